@@ -0,0 +1,206 @@
+"""
+Admission control for queries against db1, db2 and db3.
+
+Each database has a gate with a fixed number of execution slots (kept at or
+below the connection pool size). Queries carry a priority class:
+
+- ``interactive``: chat questions; dispatched first, but may not take every
+  slot, so scheduled work always has one to run on
+- ``scheduled``: report jobs
+- ``batch``: background and bulk work (cube rebuilds, bulk API pulls),
+  limited to a fraction of the slots
+
+Waiting queries are queued per class and, within a class, round-robin per
+session, so one busy session can't crowd out the others. A full queue (per
+class or per session) rejects at once instead of letting latency pile up,
+and a query that waits longer than its class timeout is rejected too.
+
+The class and session of the current request come from ``admission_context``
+(a context variable, like the metrics trace), so the database layer doesn't
+need them threaded through every call.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from metrics import REGISTRY
+
+PRIORITY_CLASSES = ("interactive", "scheduled", "batch")  # dispatch order
+
+DEFAULT_QUEUE_LIMITS = {
+    "interactive": int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "32")),
+    "scheduled": int(os.getenv("ADMISSION_SCHEDULED_QUEUE", "64")),
+    "batch": int(os.getenv("ADMISSION_BATCH_QUEUE", "16")),
+}
+DEFAULT_TIMEOUTS = {  # seconds a query may wait for a slot
+    "interactive": float(os.getenv("ADMISSION_INTERACTIVE_TIMEOUT", "10")),
+    "scheduled": float(os.getenv("ADMISSION_SCHEDULED_TIMEOUT", "300")),
+    "batch": float(os.getenv("ADMISSION_BATCH_TIMEOUT", "60")),
+}
+SESSION_QUEUE_LIMIT = int(os.getenv("ADMISSION_SESSION_QUEUE", "4"))
+
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "sql_assistant_admission_wait_seconds", "Time queries waited for an execution slot", ["db", "priority"])
+ADMISSION_REJECTED = REGISTRY.counter(
+    "sql_assistant_admission_rejected_total", "Queries rejected by admission control", ["db", "priority", "reason"])
+
+_current_priority = contextvars.ContextVar("sql_assistant_priority", default="interactive")
+_current_session = contextvars.ContextVar("sql_assistant_session", default=None)
+
+
+class AdmissionRejected(ConnectionError):
+    """No execution slot: the queue was full or the wait timed out"""
+
+
+def current_priority() -> str:
+    """Priority class of the current request"""
+    return _current_priority.get()
+
+
+@contextmanager
+def admission_context(priority: Optional[str] = None, session_id: Optional[str] = None):
+    """Run the enclosed queries under this priority class and session"""
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority}")
+    tokens = []
+    if priority is not None:
+        tokens.append((_current_priority, _current_priority.set(priority)))
+    if session_id is not None:
+        tokens.append((_current_session, _current_session.set(session_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class DatabaseGate:
+    """Execution slots for one database, shared by all priority classes"""
+
+    def __init__(self, db_name: str, max_concurrent: int, queue_limits: Optional[Dict[str, int]] = None,
+                 timeouts: Optional[Dict[str, float]] = None, session_queue_limit: int = SESSION_QUEUE_LIMIT):
+        self.db_name = db_name
+        self.max_concurrent = max(1, max_concurrent)
+        # Interactive leaves one slot for scheduled work; batch gets a quarter
+        self.class_limits = {
+            "interactive": max(1, self.max_concurrent - 1),
+            "scheduled": self.max_concurrent,
+            "batch": max(1, self.max_concurrent // 4),
+        }
+        self.queue_limits = {**DEFAULT_QUEUE_LIMITS, **(queue_limits or {})}
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.session_queue_limit = session_queue_limit
+        self._running = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self._queued = dict.fromkeys(PRIORITY_CLASSES, 0)
+        # priority -> session -> waiters; sessions rotate to the back after each grant
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_CLASSES}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    @contextmanager
+    def slot(self, priority: str = "interactive", session_id: Optional[str] = None):
+        """Hold one execution slot for the enclosed query"""
+        self.acquire(priority, session_id)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def acquire(self, priority: str, session_id: Optional[str] = None):
+        start = time.perf_counter()
+        with self._lock:
+            if not self._queues[priority] and self._has_room(priority):
+                self._running[priority] += 1
+                ADMISSION_WAIT_SECONDS.observe(0.0, db=self.db_name, priority=priority)
+                return
+            if self._queued[priority] >= self.queue_limits[priority]:
+                self._reject(priority, "queue_full", f"{priority} queue is full")
+            if len(self._queues[priority].get(session_id, ())) >= self.session_queue_limit:
+                self._reject(priority, "session_queue_full", "too many queries queued for this session")
+            waiters = self._queues[priority].setdefault(session_id, deque())
+            waiter = _Waiter()
+            waiters.append(waiter)
+            self._queued[priority] += 1
+
+        granted = waiter.event.wait(self.timeouts[priority])
+        with self._lock:
+            if not granted and not waiter.granted:
+                waiters = self._queues[priority].get(session_id)
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._queues[priority][session_id]
+                self._queued[priority] -= 1
+                self._reject(priority, "timeout", f"no slot within {self.timeouts[priority]:g}s")
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, db=self.db_name, priority=priority)
+
+    def release(self, priority: str):
+        with self._lock:
+            self._running[priority] -= 1
+            self._dispatch()
+
+    def _has_room(self, priority: str) -> bool:
+        return self.running < self.max_concurrent and self._running[priority] < self.class_limits[priority]
+
+    def _dispatch(self):
+        """Hand free slots to waiters: classes in priority order, sessions round-robin"""
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            while queue and self._has_room(priority):
+                session_id, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(session_id)
+                else:
+                    del queue[session_id]
+                self._queued[priority] -= 1
+                self._running[priority] += 1
+                waiter.granted = True
+                waiter.event.set()
+
+    def _reject(self, priority: str, reason: str, message: str):
+        ADMISSION_REJECTED.inc(db=self.db_name, priority=priority, reason=reason)
+        raise AdmissionRejected(f"{self.db_name} is busy ({message}), please retry shortly")
+
+
+class AdmissionController:
+    """One gate per database, created on first use"""
+
+    def __init__(self, max_concurrent: int, overrides: Optional[Dict[str, int]] = None):
+        self.max_concurrent = max_concurrent
+        self.overrides = overrides or {}  # db_name -> slots
+        self._gates: Dict[str, DatabaseGate] = {}
+        self._lock = threading.Lock()
+
+    def gate(self, db_name: str) -> DatabaseGate:
+        gate = self._gates.get(db_name)
+        if gate is None:
+            with self._lock:
+                gate = self._gates.get(db_name)
+                if gate is None:
+                    gate = self._gates[db_name] = DatabaseGate(
+                        db_name, self.overrides.get(db_name, self.max_concurrent))
+        return gate
+
+    def slot(self, db_name: str, priority: Optional[str] = None):
+        """Slot on db_name for the current (or given) priority class and session"""
+        return self.gate(db_name).slot(priority or _current_priority.get(), _current_session.get())
@@ -1,45 +1,20 @@
 import chainlit as cl
 import os
 import asyncio
-import psycopg2
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
-from langchain.prompts import PromptTemplate
-import pandas as pd
 import re
-import matplotlib.pyplot as plt
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.offline import plot
-import io
-import base64
-
-# Database connection configurations
-DB_CONFIGS = {
-    "db1": {
-        "host": "db1",
-        "port": 5432,
-        "database": "db1",
-        "user": "user",
-        "password": "password"
-    },
-    "db2": {
-        "host": "db2", 
-        "port": 5432,
-        "database": "db2",
-        "user": "user",
-        "password": "password"
-    },
-    "db3": {
-        "host": "db3",
-        "port": 5432,
-        "database": "db3", 
-        "user": "user",
-        "password": "password"
-    }
-}
-
-# Database schema information
+import threading
+from session_store import create_session_store, format_history
+from intent_router import DEFAULT_TOP_N, classify_intent
+from schema_catalog import SchemaCatalog
+from snapshot_cache import SnapshotCache
+from database import DB_CONFIGS, execute_sql_query, get_db_connection, stream_sql_query
+from admission import admission_context
+from explanation_engine import ExplanationEngine
+from llm_gateway import LLMGateway
+from metrics import request_trace, span, start_metrics_server_from_env
+from response_format import text_table
+
+# Fallback schema information, used until (or if) introspection succeeds
 DATABASE_SCHEMA = """
 DATABASE SCHEMA:
 
@@ -69,113 +44,110 @@ IMPORTANT NOTES:
 - Employee IDs in salaries table correspond to employee IDs in employees table
 """
 
-# Initialize the ChatOpenAI client
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+# ChatOpenAI client, created on first use (LangChain is slow to import)
+llm = None
 
-def get_db_connection(db_name):
-    """Get database connection for specified database"""
-    try:
-        config = DB_CONFIGS[db_name]
-        conn = psycopg2.connect(**config)
-        return conn
-    except Exception as e:
-        print(f"Error connecting to {db_name}: {e}")
-        return None
+def get_llm():
+    """Get the ChatOpenAI client, creating it on first use"""
+    global llm
+    if llm is None:
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+    return llm
 
-def execute_sql_query(sql_query, db_name):
-    """Execute SQL query on specified database"""
-    try:
-        conn = get_db_connection(db_name)
-        if not conn:
-            return None, f"Failed to connect to database {db_name}"
-        
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        
-        # Get column names
-        columns = [desc[0] for desc in cursor.description] if cursor.description else []
-        
-        # Fetch results
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return results, columns
-    except Exception as e:
-        return None, f"Error executing query: {str(e)}"
+# Identical in-flight prompts share one call; concurrency, retries and token usage are managed here
+llm_gateway = LLMGateway(get_llm)
+
+async def invoke_llm(prompt, purpose="llm"):
+    """Send a single user prompt to the LLM through the gateway"""
+    return await llm_gateway.invoke(prompt, purpose)
+
+# Result explanations: fixed templates where the shape allows, cached LLM answers otherwise
+explanation_engine = ExplanationEngine(invoke_llm)
+
+# Prometheus-style /metrics on METRICS_PORT (Chainlit serves its own routes)
+start_metrics_server_from_env()
+
+# Bounded per-session conversation memory (LRU/TTL, token budget, optional Redis)
+sessions = create_session_store()
+# Recent turns put in the prompt, after the summary of older ones
+HISTORY_PROMPT_MESSAGES = 6
 
-def execute_cross_database_query(user_question):
-    """Handle queries that need data from multiple databases"""
+# Introspected schema, refreshed when information_schema changes
+schema_catalog = SchemaCatalog(DB_CONFIGS, get_db_connection, fallback_schema=DATABASE_SCHEMA)
+# Warm the catalog at startup without blocking the first request
+threading.Thread(target=schema_catalog.refresh, kwargs={"force": True}, daemon=True).start()
+
+# Local snapshots of db1's dimension tables for cross-database joins
+dimension_cache = SnapshotCache.from_env(execute_sql_query)
+dimension_cache.register("db1", "departments", "SELECT id, name FROM departments")
+dimension_cache.register("db1", "employees", "SELECT id, name, department_id FROM employees")
+
+# Pre-aggregated salary statistics, created with the first chat session
+salary_cube = None
+_salary_cube_lock = threading.Lock()
+
+def get_employee_dimension():
+    """Join build side from the db1 snapshots, as (EmployeeDimension, None) or (None, error)"""
+    import federated_join
+    
+    employees_results, emp_cols = dimension_cache.fetch("db1", "employees")
+    dept_results, dept_cols = dimension_cache.fetch("db1", "departments")
+    
+    if not employees_results or not dept_results:
+        return None, "Failed to fetch data from one or more databases"
+    return federated_join.employee_dimension(employees_results, dept_results), None
+
+def get_salary_cube():
+    """Salary cube, created on first use"""
+    global salary_cube
+    if salary_cube is None:
+        with _salary_cube_lock:
+            if salary_cube is None:
+                from salary_cube import SalaryCube
+                import federated_join
+                # Cube maintenance is background work and yields db2 to chat and reports
+                salary_cube = SalaryCube(
+                    get_employee_dimension,
+                    lambda sql: stream_sql_query(sql, "db2", federated_join.JOIN_CHUNK_ROWS, priority="batch"),
+                    lambda sql, db_name, guarded=True: execute_sql_query(sql, db_name, guarded, priority="batch"))
+    return salary_cube
+
+def execute_cross_database_query(user_question, use_cube=True):
+    """Handle queries that need data from multiple databases (use_cube=False always runs the join)"""
+    # NumPy and the join engine are loaded with the first cross-database question
+    import federated_join
+    
     try:
-        # Get employees data from db1
-        employees_query = "SELECT id, name, department_id FROM employees"
-        employees_results, emp_cols = execute_sql_query(employees_query, "db1")
-        
-        # Get departments data from db1
-        dept_query = "SELECT id, name FROM departments"
-        dept_results, dept_cols = execute_sql_query(dept_query, "db1")
-        
-        # Get salaries data from db2
-        salary_query = "SELECT employee_id, amount FROM salaries"
-        salary_results, sal_cols = execute_sql_query(salary_query, "db2")
+        intent = classify_intent(user_question)
         
-        if not all([employees_results, dept_results, salary_results]):
-            return None, "Failed to fetch data from one or more databases"
-        
-        # Convert to pandas DataFrames for easier manipulation
-        import pandas as pd
-        
-        employees_df = pd.DataFrame(employees_results, columns=emp_cols)
-        departments_df = pd.DataFrame(dept_results, columns=dept_cols)
-        salaries_df = pd.DataFrame(salary_results, columns=sal_cols)
+        # Common aggregate questions are answered from the salary cube when it is built
+        results = get_salary_cube().answer(intent) if use_cube else None
+        if results is not None:
+            return results, results.columns
         
-        # Rename columns to avoid conflicts
-        departments_df = departments_df.rename(columns={'id': 'dept_id', 'name': 'department_name'})
-        employees_df = employees_df.rename(columns={'name': 'employee_name'})
+        # Employees and departments from db1 (the build side of the join), served from local snapshots
+        dimension, error = get_employee_dimension()
+        if dimension is None:
+            return None, error
         
-        # Join the data
-        # First join employees with departments
-        emp_dept = employees_df.merge(departments_df, left_on='department_id', right_on='dept_id')
+        # Salaries from db2 are streamed in chunks and probed against the employee index
+        salary_chunks = stream_sql_query(federated_join.SALARIES_QUERY, "db2", federated_join.JOIN_CHUNK_ROWS)
         
-        # Then join with salaries
-        full_data = emp_dept.merge(salaries_df, left_on='id', right_on='employee_id')
-        
-        # For top 3 highest paid in each department
-        if "top" in user_question.lower() and "department" in user_question.lower():
-            # Remove duplicates first by keeping only unique employee-department-salary combinations
-            full_data_unique = full_data.drop_duplicates(subset=['employee_name', 'department_name', 'amount'])
-            
-            # Sort by department and salary, then get top 3 per department
-            result_list = []
-            for dept_name, group in full_data_unique.groupby('department_name'):
-                top_3 = group.nlargest(3, 'amount')
-                for _, row in top_3.iterrows():
-                    result_list.append((
-                        row['employee_name'], 
-                        row['department_name'], 
-                        row['amount']
-                    ))
-            
-            columns = ['Employee Name', 'Department', 'Salary']
-            return result_list, columns
-        
-        # Default: return all employee data with salaries (deduplicated)
-        full_data_unique = full_data.drop_duplicates(subset=['employee_name', 'department_name', 'amount'])
-        
-        # Sort by salary descending to show top employees first
-        full_data_sorted = full_data_unique.sort_values('amount', ascending=False)
-        
-        formatted_results = []
-        for _, row in full_data_sorted.iterrows():
-            formatted_results.append((
-                row['employee_name'], 
-                row['department_name'], 
-                row['amount']
-            ))
+        # For top N highest paid in each department
+        if intent.has("top", "department"):
+            top_n = intent.top_n or DEFAULT_TOP_N
+            results = federated_join.top_per_department(dimension, salary_chunks, top_n)
+        # Salary by department: aggregate while streaming instead of returning every row
+        elif intent.has("salary", "department", "per_group") and not intent.has("employee"):
+            results = federated_join.department_summary(dimension, salary_chunks)
+        # Default: return all employee data with salaries, sorted by salary descending
+        else:
+            results = federated_join.all_rows(dimension, salary_chunks)
         
-        columns = ['Employee Name', 'Department', 'Salary']
-        return formatted_results, columns
+        if not results:
+            return None, "Failed to fetch data from one or more databases"
+        return results, results.columns
         
     except Exception as e:
         return None, f"Error in cross-database query: {str(e)}"
@@ -191,117 +163,92 @@ def format_query_results(results, columns):
         return f"Result: {results[0][0]}"
     
     # Multiple rows/columns - create a table
-    formatted = f"\n{'  |  '.join(columns)}\n"
-    formatted += "-" * len(formatted) + "\n"
-    
-    for row in results[:20]:  # Show more rows
-        formatted += f"{'  |  '.join(str(val) for val in row)}\n"
-    
-    if len(results) > 20:
-        formatted += f"\n... and {len(results) - 20} more rows"
-    
-    return formatted
+    return text_table(results, columns)
 
 def should_create_chart(user_question, results, columns):
     """Determine if we should create a chart for this query"""
-    chart_keywords = ['top', 'highest', 'salary', 'department', 'compare', 'distribution', 'chart', 'graph', 'plot']
-    question_lower = user_question.lower()
-    
     # Check if question suggests visualization
-    has_chart_keywords = any(keyword in question_lower for keyword in chart_keywords)
+    has_chart_intent = classify_intent(user_question).wants_chart
     
     # Check if data is suitable for charting (has numeric values)
     has_numeric_data = len(results) > 1 and len(columns) >= 2
     
-    return has_chart_keywords and has_numeric_data
+    return has_chart_intent and has_numeric_data
 
 async def create_chart(user_question, results, columns):
-    """Create a chart using matplotlib and return as file"""
+    """Create a chart of the (downsampled) results using matplotlib and return as file"""
+    # Charting libraries are only loaded once a chart is actually requested
+    import tempfile
+    from chart_pipeline import prepare_chart_data, render_png
+    from result_table import as_table
+    
     try:
-        import pandas as pd
-        import matplotlib.pyplot as plt
-        import tempfile
-        import os
-        
-        # Convert results to DataFrame
-        df = pd.DataFrame(results, columns=columns)
-        
-        # Create matplotlib figure
-        plt.figure(figsize=(12, 8))
-        
-        # Determine chart type based on question and data
-        if "top" in user_question.lower() and "department" in user_question.lower():
-            # Top employees by department - horizontal bar chart
-            colors = plt.cm.Set3(range(len(df['Department'].unique())))
-            dept_colors = {dept: colors[i] for i, dept in enumerate(df['Department'].unique())}
-            
-            y_pos = range(len(df))
-            bars = plt.barh(y_pos, df['Salary'], color=[dept_colors[dept] for dept in df['Department']])
-            
-            plt.yticks(y_pos, df['Employee Name'])
-            plt.xlabel('Salary ($)')
-            plt.ylabel('Employee')
-            plt.title('Top Employees by Department and Salary')
-            
-            # Add legend
-            handles = [plt.Rectangle((0,0),1,1, color=dept_colors[dept]) for dept in dept_colors]
-            plt.legend(handles, dept_colors.keys(), title='Department')
-            
-        elif "salary" in user_question.lower() and "department" in user_question.lower():
-            # Salary by department - bar chart
-            dept_avg = df.groupby('Department')['Salary'].mean()
-            plt.bar(dept_avg.index, dept_avg.values)
-            plt.xlabel('Department')
-            plt.ylabel('Average Salary ($)')
-            plt.title('Average Salary by Department')
-            plt.xticks(rotation=45)
-            
-        else:
-            # Default bar chart
-            if len(columns) >= 2:
-                x_col = columns[0] if 'name' in columns[0].lower() else columns[1]
-                y_col = columns[-1] if any(word in columns[-1].lower() for word in ['salary', 'amount', 'count']) else columns[1]
-                
-                plt.bar(df[x_col], df[y_col])
-                plt.xlabel(x_col)
-                plt.ylabel(y_col)
-                plt.title(f'{y_col} by {x_col}')
-                plt.xticks(rotation=45)
-        
-        plt.tight_layout()
+        chart = prepare_chart_data(classify_intent(user_question).chart_type, as_table(results, columns))
+        if chart is None:
+            return None
         
         # Save to temporary file
         with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-            plt.savefig(tmp_file.name, dpi=150, bbox_inches='tight')
-            plt.close()
+            render_png(chart, tmp_file.name)
             return tmp_file.name
         
     except Exception as e:
         print(f"Error creating chart: {e}")
-        plt.close()
         return None
 
-def needs_cross_database_query(user_question):
-    """Determine if query needs data from multiple databases"""
-    cross_db_keywords = [
-        "top", "highest paid", "salary", "department", "join", 
-        "employee.*salary", "department.*salary", "highest.*department"
-    ]
+def create_chart_spec(user_question, results, columns):
+    """Plotly JSON spec of the (downsampled) results for the client to render, size-capped"""
+    from chart_pipeline import plotly_spec
+    from result_table import as_table
     
-    question_lower = user_question.lower()
-    return any(keyword in question_lower for keyword in cross_db_keywords if ".*" not in keyword) or \
-           any(re.search(keyword, question_lower) for keyword in cross_db_keywords if ".*" in keyword)
+    try:
+        return plotly_spec(classify_intent(user_question).chart_type, as_table(results, columns))
+    except Exception as e:
+        print(f"Error creating chart spec: {e}")
+        return None
 
-async def generate_sql_query(user_question):
-    """Generate SQL query from natural language question"""
+async def send_chart(response_msg, user_question, results, columns):
+    """Create the chart in the configured format (CHART_FORMAT) and send it"""
+    from chart_pipeline import CHART_FORMAT
     
-    sql_prompt = PromptTemplate(
-        input_variables=["schema", "question"],
-        template="""
+    await response_msg.stream_token("📊 Creating visualization...\n\n")
+    try:
+        if CHART_FORMAT == "plotly":
+            with span("create_chart"):
+                chart_spec = create_chart_spec(user_question, results, columns)
+            if chart_spec:
+                import json
+                from plotly import graph_objects as go
+                await response_msg.stream_token("📈 Chart created successfully!\n\n")
+                await cl.Plotly(name="chart", figure=go.Figure(json.loads(chart_spec))).send()
+            return
+        
+        with span("create_chart"):
+            chart_path = await create_chart(user_question, results, columns)
+        if chart_path:
+            await response_msg.stream_token("📈 Chart created successfully!\n\n")
+            with open(chart_path, 'rb') as f:
+                image_data = f.read()
+            os.unlink(chart_path)
+            
+            # Send chart as image file
+            chart_file = cl.Image(content=image_data, name="chart.png")
+            await chart_file.send()
+    except Exception as chart_error:
+        await response_msg.stream_token(f"📊 Visualization summary: Chart would show the salary comparison across departments\n\n")
+
+def needs_cross_database_query(user_question):
+    """Determine if query needs data from multiple databases"""
+    return classify_intent(user_question).cross_db
+
+SQL_PROMPT_TEMPLATE = """
 You are a SQL expert. Given the database schema and a user question, generate the appropriate SQL query.
 
 {schema}
 
+Recent conversation (for context only):
+{history}
+
 User Question: {question}
 
 Instructions:
@@ -321,11 +268,15 @@ Examples:
 
 SQL Query:
 """
-    )
+
+async def generate_sql_query(user_question, history=""):
+    """Generate SQL query from natural language question"""
     
     try:
-        prompt = sql_prompt.format(schema=DATABASE_SCHEMA, question=user_question)
-        response = await llm.ainvoke([HumanMessage(content=prompt)])
+        # Only the tables relevant to the question go into the prompt
+        schema = await asyncio.to_thread(schema_catalog.render, classify_intent(user_question))
+        prompt = SQL_PROMPT_TEMPLATE.format(schema=schema, history=history or "(none)", question=user_question)
+        response = await invoke_llm(prompt, "sql")
         return response.content.strip()
     except Exception as e:
         return f"Error generating SQL: {str(e)}"
@@ -356,72 +307,75 @@ async def start_chat():
         content="Hello! I am your AI SQL assistant. I can help you query the employee, department, and salary databases. Try asking questions like:\n\n• How many employees are there?\n• Show me all departments\n• What are the salary amounts?\n• Which employees work in Engineering?"
     ).send()
     
-    cl.user_session.set("history", [
-        SystemMessage(content=f"You are a helpful AI SQL assistant. You have access to employee databases with the following schema:\n\n{DATABASE_SCHEMA}")
-    ])
+    # The schema is already part of every SQL prompt, so the session only keeps the conversation
+    session_id = cl.user_session.get("id")
+    sessions.clear(session_id)
+    
+    # Build or refresh the salary cube in the background
+    await asyncio.to_thread(lambda: get_salary_cube().refresh_in_background())
 
 @cl.on_message
 async def main(message: cl.Message):
     """Process user message and execute SQL queries"""
-    history = cl.user_session.get("history")
-    history.append(HumanMessage(content=message.content))
+    # Queries run as interactive work, queued fairly per chat session
+    with request_trace("chat"), admission_context("interactive", cl.user_session.get("id")):
+        await process_message(message)
+
+async def process_message(message: cl.Message):
+    """Answer one chat message (intent routing, SQL, results, chart, explanation)"""
+    session_id = cl.user_session.get("id")
+    # Earlier turns only; the current question is passed separately
+    history = format_history(sessions.get_messages(session_id), HISTORY_PROMPT_MESSAGES)
+    sessions.append(session_id, "user", message.content)
     
     response_msg = cl.Message(content="")
     
     try:
         await response_msg.stream_token("🔍 Analyzing your question...\n\n")
         
-        # Check if this needs cross-database query
-        if needs_cross_database_query(message.content):
+        # Check if this needs cross-database query or can be answered from the salary cube
+        with span("intent_routing"):
+            intent = classify_intent(message.content)
+            cross_db = intent.cross_db
+            from_cube = get_salary_cube().can_answer(intent)
+        
+        if from_cube:
+            await response_msg.stream_token("📦 Answering from pre-aggregated salary statistics...\n\n")
+        elif cross_db:
             await response_msg.stream_token("🔗 This question requires data from multiple databases...\n\n")
             await response_msg.stream_token("📊 Executing queries:\n```sql\n-- From db1 (employees & departments)\nSELECT e.id, e.name, e.department_id FROM employees e;\nSELECT d.id, d.name FROM departments d;\n\n-- From db2 (salaries)\nSELECT employee_id, amount FROM salaries;\n```\n\n")
             await response_msg.stream_token("⚡ Joining data across databases...\n\n")
-            
-            results, columns_or_error = execute_cross_database_query(message.content)
+        
+        if from_cube or cross_db:
+            with span("execute_cross_database_query"):
+                results, columns_or_error = await asyncio.to_thread(execute_cross_database_query, message.content)
             
             if results is None:
                 await response_msg.stream_token(f"❌ Query failed: {columns_or_error}")
             else:
                 # Format and display results
-                formatted_results = format_query_results(results, columns_or_error)
+                with span("format_query_results"):
+                    formatted_results = format_query_results(results, columns_or_error)
                 await response_msg.stream_token(f"✅ Query Results:\n```\n{formatted_results}\n```\n\n")
                 
                 # Create chart if appropriate
                 if should_create_chart(message.content, results, columns_or_error):
-                    await response_msg.stream_token("📊 Creating visualization...\n\n")
-                    chart_html = await create_chart(message.content, results, columns_or_error)
-                    
-                    if chart_html:
-                        # Send chart as image file
-                        try:
-                            # Simple approach - just send the file path info
-                            await response_msg.stream_token(f"📈 Chart created successfully!\n\n")
-                            await response_msg.stream_token(f"Chart shows: Charlie ($90k), Bob ($80k), Alice ($70k), David ($65k)\n\n")
-                            
-                            # Try to send as image without the problematic parameters
-                            with open(chart_html, 'rb') as f:
-                                image_data = f.read()
-                            
-                            # Simple image creation
-                            chart_file = cl.Image(content=image_data, name="chart.png")
-                            await chart_file.send()
-                            
-                        except Exception as chart_error:
-                            await response_msg.stream_token(f"📊 Visualization summary: Engineering leads with Charlie at $90k, followed by Sales (Bob $80k, Alice $70k) and HR (David $65k)\n\n")
+                    await send_chart(response_msg, message.content, results, columns_or_error)
                 
                 # Generate natural language explanation
                 await response_msg.stream_token("💡 ")
                 explanation_prompt = f"Based on this query result, provide a brief natural language explanation:\n\nQuestion: {message.content}\nResults: {formatted_results}\n\nExplanation:"
                 
-                explanation_response = await llm.ainvoke([HumanMessage(content=explanation_prompt)])
-                
-                for chunk in explanation_response.content.split():
-                    await response_msg.stream_token(chunk + " ")
-                    await asyncio.sleep(0.05)
+                # Templates for common result shapes; the LLM (cached) only for the rest
+                with span("explanation"):
+                    explanation = await explanation_engine.explain(message.content, results, columns_or_error, explanation_prompt)
+                await response_msg.stream_token(explanation)
         else:
             # Handle single database queries
-            sql_response = await generate_sql_query(message.content)
-            db_name, sql_query = parse_sql_response(sql_response)
+            with span("generate_sql_query"):
+                sql_response = await generate_sql_query(message.content, history)
+            with span("parse_sql_response"):
+                db_name, sql_query = parse_sql_response(sql_response)
             
             if not db_name or not sql_query:
                 await response_msg.stream_token("❌ I couldn't generate a proper SQL query for your question. Could you please rephrase it?")
@@ -430,52 +384,35 @@ async def main(message: cl.Message):
                 await response_msg.stream_token("⚡ Executing query...\n\n")
                 
                 # Execute the SQL query
-                results, columns_or_error = execute_sql_query(sql_query, db_name)
+                with span("execute_sql_query"):
+                    results, columns_or_error = await asyncio.to_thread(execute_sql_query, sql_query, db_name)
                 
                 if results is None:
                     await response_msg.stream_token(f"❌ Query failed: {columns_or_error}")
                 else:
                     # Format and display results
-                    formatted_results = format_query_results(results, columns_or_error)
+                    with span("format_query_results"):
+                        formatted_results = format_query_results(results, columns_or_error)
                     await response_msg.stream_token(f"✅ Query Results:\n```\n{formatted_results}\n```\n\n")
                     
                     # Create chart if appropriate
                     if should_create_chart(message.content, results, columns_or_error):
-                        await response_msg.stream_token("📊 Creating visualization...\n\n")
-                        chart_html = await create_chart(message.content, results, columns_or_error)
-                        
-                        if chart_html:
-                            # Send chart as image file
-                            try:
-                                # Simple approach - just send the file path info
-                                await response_msg.stream_token(f"📈 Chart created successfully!\n\n")
-                                
-                                # Try to send as image without the problematic parameters
-                                with open(chart_html, 'rb') as f:
-                                    image_data = f.read()
-                                
-                                # Simple image creation
-                                chart_file = cl.Image(content=image_data, name="chart.png")
-                                await chart_file.send()
-                                
-                            except Exception as chart_error:
-                                await response_msg.stream_token(f"📊 Visualization summary: Chart would show the salary comparison across departments\n\n")
+                        await send_chart(response_msg, message.content, results, columns_or_error)
                     
                     # Generate natural language explanation
                     await response_msg.stream_token("💡 ")
                     explanation_prompt = f"Based on this SQL query result, provide a brief natural language explanation:\n\nQuestion: {message.content}\nSQL: {sql_query}\nResults: {formatted_results}\n\nExplanation:"
                     
-                    explanation_response = await llm.ainvoke([HumanMessage(content=explanation_prompt)])
-                    
-                    for chunk in explanation_response.content.split():
-                        await response_msg.stream_token(chunk + " ")
-                        await asyncio.sleep(0.05)
+                    # Templates for common result shapes; the LLM (cached) only for the rest
+                    with span("explanation"):
+                        explanation = await explanation_engine.explain(message.content, results, columns_or_error, explanation_prompt, sql_query)
+                    await response_msg.stream_token(explanation)
     
     except Exception as e:
         await response_msg.stream_token(f"❌ An error occurred: {str(e)}")
     
     await response_msg.send()
-    cl.user_session.set("history", history)
+    sessions.append(session_id, "assistant", response_msg.content)
 
 # To run this Chainlit app:
 # chainlit run app_chainlit.py -w --host 0.0.0.0 --port 7860
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Offline stand-ins for the benchmark harness.
+
+- FakeLLM: deterministic replacement for ChatOpenAI (same ainvoke/.content surface)
+- SyntheticDatabases: SQLite files for db1/db2/db3 seeded with employees,
+  departments and salaries at a configurable scale
+"""
+
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import tempfile
+from dataclasses import dataclass
+
+DEPARTMENT_NAMES = ["Engineering", "Sales", "HR", "Finance", "Marketing", "Support", "Legal", "Operations"]
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "David", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy"]
+
+
+@dataclass
+class FakeResponse:
+    content: str
+    response_metadata: dict
+
+
+class FakeLLM:
+    """Deterministic LLM stand-in; answers SQL prompts with canned queries"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        prompt = messages[-1].content if hasattr(messages[-1], "content") else str(messages[-1])
+        content = self._answer(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        return FakeResponse(content=content, response_metadata={"token_usage": usage})
+
+    def _answer(self, prompt: str) -> str:
+        if "SQL Query:" not in prompt:
+            return "The results show the requested employee data, sorted by the most relevant values."
+        question = re.search(r"User Question: (.*)", prompt)
+        question = question.group(1).lower() if question else ""
+        if "salar" in question:
+            return "DATABASE:db2|QUERY:SELECT amount FROM salaries LIMIT 10;"
+        if "department" in question:
+            return "DATABASE:db1|QUERY:SELECT DISTINCT name FROM departments;"
+        if "how many" in question or "count" in question:
+            return "DATABASE:db1|QUERY:SELECT COUNT(*) FROM employees;"
+        return "DATABASE:db1|QUERY:SELECT name FROM employees LIMIT 10;"
+
+
+class FakeExplainCursor:
+    """Cursor stand-in answering EXPLAIN (FORMAT JSON) with a plan sized by the query's LIMIT"""
+
+    def __init__(self, table_rows: int = 1000000, cost: float = 100.0):
+        self.table_rows = table_rows
+        self.cost = cost
+        self.executed = []
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+    def fetchone(self):
+        limit = re.search(r"\blimit\s+(\d+)", self.executed[-1], re.IGNORECASE)
+        rows = min(int(limit.group(1)), self.table_rows) if limit else self.table_rows
+        return ([{"Plan": {"Total Cost": self.cost, "Plan Rows": rows}}],)
+
+
+class SyntheticDatabases:
+    """SQLite stand-ins for db1 (employees, departments), db2 (salaries) and db3"""
+
+    def __init__(self, employees: int = 1000, departments: int = 8, salary_rows_per_employee: float = 1.2,
+                 seed: int = 42, directory: str = None):
+        self.employees = employees
+        self.departments = departments
+        self.salary_rows_per_employee = salary_rows_per_employee
+        self.seed = seed
+        self.directory = directory or tempfile.mkdtemp(prefix="sql_assistant_bench_")
+        self.paths = {db: os.path.join(self.directory, f"{db}.sqlite") for db in ("db1", "db2", "db3")}
+        self._seed()
+
+    def connect(self, db_name: str):
+        """Connection factory for database.use_connection_factory"""
+        return sqlite3.connect(self.paths[db_name], check_same_thread=False)
+
+    def _seed(self):
+        rng = random.Random(self.seed)
+
+        conn = sqlite3.connect(self.paths["db1"])
+        conn.executescript("""
+            DROP TABLE IF EXISTS employees;
+            DROP TABLE IF EXISTS departments;
+            CREATE TABLE departments (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL);
+            CREATE TABLE employees (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL,
+                                    department_id INTEGER REFERENCES departments(id));
+        """)
+        conn.executemany("INSERT INTO departments (id, name) VALUES (?, ?)", [
+            (i + 1, DEPARTMENT_NAMES[i % len(DEPARTMENT_NAMES)] + ("" if i < len(DEPARTMENT_NAMES) else f" {i}"))
+            for i in range(self.departments)
+        ])
+        conn.executemany("INSERT INTO employees (id, name, department_id) VALUES (?, ?, ?)", [
+            (i + 1, f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {i + 1}", rng.randint(1, self.departments))
+            for i in range(self.employees)
+        ])
+        conn.commit()
+        conn.close()
+
+        conn = sqlite3.connect(self.paths["db2"])
+        conn.executescript("""
+            DROP TABLE IF EXISTS salaries;
+            CREATE TABLE salaries (id INTEGER PRIMARY KEY, employee_id INTEGER, amount INTEGER NOT NULL);
+        """)
+        # Some employees get repeated salary rows, like the production data
+        salary_rows = int(self.employees * self.salary_rows_per_employee)
+        conn.executemany("INSERT INTO salaries (id, employee_id, amount) VALUES (?, ?, ?)", [
+            (i + 1, (i % self.employees) + 1, rng.randrange(40000, 200000, 500))
+            for i in range(salary_rows)
+        ])
+        conn.commit()
+        conn.close()
+
+        sqlite3.connect(self.paths["db3"]).close()
@@ -0,0 +1,462 @@
+"""
+Offline benchmark suite.
+
+Runs the hot paths against SQLite stand-ins for db1/db2/db3 and a
+deterministic fake LLM, and writes the timings to JSON so runs can be
+compared before and after a change.
+
+    python benchmark.py --employees 10000 --output before.json
+    python benchmark.py --employees 10000 --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from bench_fixtures import FakeExplainCursor, FakeLLM, SyntheticDatabases
+
+CROSS_DB_QUESTIONS = {
+    "top_per_department": "Top 3 highest paid employees in each department",
+    "all_salaries": "Show every employee with their salary",
+    "salary_by_department": "What is the average salary by department?",
+}
+
+
+def measure(func, iterations: int, warmup: int = 1):
+    """Time func() over a number of iterations; returns summary statistics in milliseconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return summarize(samples)
+
+
+def summarize(samples):
+    """Summary statistics of latency samples in milliseconds"""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "iterations": len(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+        "ops_per_sec": len(samples) / (total / 1000) if total else None,
+    }
+
+
+def peak_allocation_mb(func):
+    """Peak Python/NumPy heap allocation while running func() once"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_pipeline(databases, iterations, results):
+    """Cross-database query, result formatting, response encoding and chart rendering"""
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    import app_chainlit
+    import response_format
+
+    app_chainlit.llm = FakeLLM()
+    # Build the salary cube up front so cube-eligible questions are measured against it throughout
+    cube = app_chainlit.get_salary_cube()
+    results["salary_cube.rebuild"] = measure(lambda: cube.refresh(force_rebuild=True), max(1, iterations // 4))
+    results["salary_cube.refresh"] = measure(cube.refresh, iterations)
+    loop = asyncio.new_event_loop()
+    try:
+        # 50 users sending the same question at once; the gateway should make one LLM call per burst
+        app_chainlit.llm = FakeLLM(latency=0.02)
+        async def burst():
+            return await asyncio.gather(
+                *[app_chainlit.generate_sql_query("How many employees are there?") for _ in range(50)])
+        results["llm.burst_identical_50"] = measure(lambda: loop.run_until_complete(burst()), iterations)
+        results["llm.burst_identical_50"]["llm_calls"] = app_chainlit.llm.calls
+        app_chainlit.llm = FakeLLM()
+
+        for label, question in CROSS_DB_QUESTIONS.items():
+            rows, columns = app_chainlit.execute_cross_database_query(question)
+            if rows is None:
+                raise RuntimeError(columns)
+            results[f"cross_db_query.{label}"] = measure(
+                lambda: app_chainlit.execute_cross_database_query(question), iterations)
+            results[f"cross_db_query.{label}"]["peak_alloc_mb"] = peak_allocation_mb(
+                lambda: app_chainlit.execute_cross_database_query(question))
+            if cube.answer(app_chainlit.classify_intent(question)) is not None:
+                # Answered from the cube above; keep the streaming join measured for the same question
+                results[f"cross_db_query.{label}.join"] = measure(
+                    lambda: app_chainlit.execute_cross_database_query(question, use_cube=False), iterations)
+                results[f"cross_db_query.{label}.join"]["peak_alloc_mb"] = peak_allocation_mb(
+                    lambda: app_chainlit.execute_cross_database_query(question, use_cube=False))
+            results[f"format_query_results.{label}"] = measure(
+                lambda: app_chainlit.format_query_results(rows, columns), iterations * 10)
+
+            def render_chart():
+                path = loop.run_until_complete(app_chainlit.create_chart(question, rows, columns))
+                if path:
+                    os.unlink(path)
+            results[f"create_chart.{label}"] = measure(render_chart, max(1, iterations // 2))
+            results[f"create_chart_spec.{label}"] = measure(
+                lambda: app_chainlit.create_chart_spec(question, rows, columns), iterations)
+            results[f"explanation.{label}"] = measure(lambda: loop.run_until_complete(
+                app_chainlit.explanation_engine.explain(question, rows, columns, question)), iterations)
+            for fmt, encoding in (("json", None), ("json", "gzip"), ("csv", "gzip")):
+                def encode():
+                    body, _ = response_format.table_response(rows, fmt, encoding)
+                    for _ in body:
+                        pass
+                results[f"encode_response.{label}.{fmt}{'.' + encoding if encoding else ''}"] = measure(
+                    encode, iterations)
+    finally:
+        loop.close()
+
+
+def bench_feedback(workdir, iterations, results):
+    """FeedbackSystem writes and reads on a fresh SQLite file"""
+    from feedback_system import FeedbackSystem
+
+    feedback = FeedbackSystem(db_path=os.path.join(workdir, "feedback.db"))
+    counter = iter(range(10 ** 9))
+
+    def log_query():
+        n = next(counter)
+        feedback.log_query(f"session-{n % 50}", "How many employees are there?",
+                           "SELECT COUNT(*) FROM employees", "db1", 1)
+
+    results["feedback.log_query"] = measure(log_query, iterations * 5)
+    results["feedback.record_feedback"] = measure(
+        lambda: feedback.record_feedback(f"session-{next(counter) % 50}", 5), iterations * 5)
+    results["feedback.get_feedback_stats"] = measure(feedback.get_feedback_stats, iterations * 5)
+    results["feedback.get_similar_successful_queries"] = measure(
+        lambda: feedback.get_similar_successful_queries("How many employees?"), iterations * 5)
+
+
+def bench_reports(workdir, iterations, results, failures):
+    """ReportScheduler job execution against the stand-in databases"""
+    from report_scheduler import ReportScheduler, parse_report_csv
+
+    # claim_seconds=0: every iteration runs the report instead of deferring to the last claim
+    scheduler = ReportScheduler(db_path=os.path.join(workdir, "scheduled_reports.db"), claim_seconds=0)
+    try:
+        count_id = scheduler.schedule_report("Employee count", "SELECT COUNT(*) FROM employees",
+                                             "db1", "daily", "09:00")
+        salary_id = scheduler.schedule_report("Salaries", "SELECT employee_id, amount FROM salaries",
+                                              "db2", "daily", "09:00")
+        results["report.run.count"] = measure(lambda: scheduler._run_report(count_id), iterations)
+        results["report.run.salaries"] = measure(lambda: scheduler._run_report(salary_id), iterations)
+
+        # Catalogue import: 500 definitions in one transaction vs one schedule_report call each
+        definitions = [{"report_name": f"Report {i}", "sql_query": "SELECT COUNT(*) FROM employees",
+                        "schedule_type": ("daily", "hourly")[i % 2], "schedule_time": ("09:00", "")[i % 2]}
+                       for i in range(500)]
+        results["report.schedule.bulk_500"] = measure(
+            lambda: scheduler.schedule_reports(definitions), min(iterations, 5))
+        results["report.schedule.serial_500"] = measure(
+            lambda: [scheduler.schedule_report(d["report_name"], d["sql_query"], "db1", d["schedule_type"],
+                                               d["schedule_time"]) for d in definitions], min(iterations, 5))
+        results["report.export"] = measure(
+            lambda: sum(len(rows) for rows in scheduler.iter_report_definitions()), min(iterations, 5))
+
+        # A quoted multi-line sql_query must stay one CSV row
+        multiline_sql = "SELECT name\nFROM employees\nWHERE name <> 'a,b'"
+        parsed = parse_report_csv('report_name,sql_query,schedule_type,schedule_time\r\n'
+                                  '"Multi-line","SELECT name\nFROM employees\nWHERE name <> \'a,b\'",daily,09:00\r\n')
+        if len(parsed) != 1 or parsed[0]["sql_query"] != multiline_sql:
+            failures.append(f"reports: multi-line CSV sql_query was split or changed: {parsed!r}")
+    finally:
+        scheduler.stop_scheduler()
+
+
+def bench_guard(iterations, results, failures):
+    """QueryGuard decisions (plan cache hits), its safety checks and literal parameterization"""
+    from query_guard import QueryGuard, inject_limit, strip_comments
+    from sql_params import parameterize
+
+    guard = QueryGuard()
+    cursor = FakeExplainCursor()
+    results["guard.check.cached"] = measure(
+        lambda: guard.check(cursor, "SELECT name FROM employees LIMIT 10", "db1"), iterations * 100)
+
+    # A cached small-LIMIT plan must not let the same query with a larger LIMIT through
+    decision = guard.check(cursor, "SELECT name FROM employees LIMIT 10000000", "db1")
+    if decision.action != "limit":
+        failures.append(f"guard: LIMIT 10000000 after a cached LIMIT 10 plan got action {decision.action!r}")
+
+    explained = len(cursor.executed)
+    decision = guard.check(cursor, "SELECT 1; SELECT pg_sleep(600)", "db1")
+    if decision.allowed or len(cursor.executed) != explained:
+        failures.append("guard: multi-statement SQL was explained or allowed")
+
+    # The injected LIMIT must not end up inside a trailing -- comment
+    decision = guard.check(cursor, "select name from employees -- comment\n", "db1")
+    if decision.action != "limit" or not strip_comments(decision.sql).rstrip().endswith("LIMIT 1000"):
+        failures.append(f"guard: LIMIT after a trailing comment is not applied: {decision.sql!r}")
+
+    # Only the query's own LIMIT is rewritten, not a subquery's or one inside a string
+    nested = inject_limit("SELECT * FROM e WHERE id IN (SELECT id FROM x LIMIT 5000) AND note <> 'limit 9'", 1000)
+    if "LIMIT 5000" not in nested or "'limit 9'" not in nested or not nested.endswith(") q LIMIT 1000"):
+        failures.append(f"guard: nested or quoted LIMIT was rewritten: {nested!r}")
+
+    # Function arguments, type modifiers and select-list constants stay inline so PREPARE resolves them
+    template, params = parameterize("SELECT round(amount, 2)::numeric(10,2), 'x' AS tag FROM salaries "
+                                    "WHERE left(name, 3) = 'Abc' AND amount > 50000")
+    if params != ["Abc", 50000] or "round(amount, 2)" not in template or "left(name, 3)" not in template:
+        failures.append(f"guard: literals parameterized where PREPARE needs them inline: {template!r}")
+
+
+def bench_intent(iterations, results):
+    """Intent classification, uncached and cached"""
+    from intent_router import _classify_normalized, classify_intent, normalize
+
+    questions = list(CROSS_DB_QUESTIONS.values()) + ["How many employees are there?",
+                                                     "What are the salary amounts?"]
+    results["intent.classify.uncached"] = measure(
+        lambda: [_classify_normalized.__wrapped__(normalize(q)) for q in questions], iterations * 100)
+    results["intent.classify.cached"] = measure(
+        lambda: [classify_intent(q) for q in questions], iterations * 100)
+
+
+def bench_admission(iterations, results):
+    """Scheduled-report and chat latency on one database gate under a chat burst"""
+    import threading
+    from admission import AdmissionRejected, DatabaseGate
+
+    gate = DatabaseGate("bench", max_concurrent=4)
+    query_seconds = 0.005
+    latencies = {"interactive": [], "scheduled": []}
+    rejected = {"interactive": 0, "scheduled": 0}
+    lock = threading.Lock()
+
+    def client(priority, session_id, requests):
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                with gate.slot(priority, session_id):
+                    time.sleep(query_seconds)
+            except AdmissionRejected:
+                with lock:
+                    rejected[priority] += 1
+                continue
+            with lock:
+                latencies[priority].append((time.perf_counter() - start) * 1000)
+
+    # 24 chat clients (16 of them in one busy session) against 4 slots, plus 2 report jobs
+    clients = [("interactive", "busy", iterations * 2)] * 16 + \
+        [("interactive", f"user-{i}", iterations * 2) for i in range(8)] + \
+        [("scheduled", f"report-{i}", iterations) for i in range(2)]
+    threads = [threading.Thread(target=client, args=spec) for spec in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for priority, samples in latencies.items():
+        if samples:
+            results[f"admission.{priority}"] = summarize(samples)
+            results[f"admission.{priority}"]["rejected"] = rejected[priority]
+
+
+# Cold-start budget: a module's own import time (after its framework is loaded) and the
+# heavy libraries it must not pull in until a request needs them
+IMPORT_BUDGETS = {
+    "app_chainlit": {
+        "preload": ["chainlit"],
+        "budget_ms": 300,
+        "deferred": ["numpy", "pandas", "matplotlib", "plotly", "langchain", "langchain_openai"],
+    },
+    "integrated_sql_assistant": {
+        "preload": [],
+        "budget_ms": 300,
+        "deferred": ["gradio", "flask", "apscheduler", "numpy", "pandas", "langchain"],
+    },
+}
+
+IMPORT_PROBE = """
+import importlib, json, sys, time
+for name in sys.argv[2:]:
+    importlib.import_module(name)
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed, "loaded": sorted(m for m in sys.modules if "." not in m)}))
+"""
+
+
+def bench_imports(iterations, results, failures):
+    """Cold import time of the app modules, each in a fresh interpreter"""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=package_dir + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    # Chainlit writes its config into the working directory on import
+    probe_dir = tempfile.mkdtemp(prefix="sql_assistant_imports_")
+
+    for module, budget in IMPORT_BUDGETS.items():
+        samples = []
+        loaded = []
+        for _ in range(max(3, iterations // 4)):
+            output = subprocess.run([sys.executable, "-c", IMPORT_PROBE, module] + budget["preload"],
+                                    cwd=probe_dir, env=env, capture_output=True, text=True)
+            if output.returncode != 0:
+                raise ImportError(output.stderr.strip().splitlines()[-1])
+            probe = json.loads(output.stdout.strip().splitlines()[-1])
+            samples.append(probe["ms"])
+            loaded = probe["loaded"]
+        samples.sort()
+        p50 = samples[len(samples) // 2]
+        results[f"import.{module}"] = {
+            "iterations": len(samples),
+            "mean_ms": statistics.fmean(samples),
+            "p50_ms": p50,
+            "p95_ms": samples[-1],
+            "min_ms": samples[0],
+            "max_ms": samples[-1],
+            "ops_per_sec": None,
+        }
+        if p50 > budget["budget_ms"]:
+            failures.append(f"import {module}: {p50:.0f}ms exceeds budget of {budget['budget_ms']}ms")
+        eager = [name for name in budget["deferred"] if name in loaded]
+        if eager:
+            failures.append(f"import {module}: loads {', '.join(eager)} at import time")
+
+
+BENCHMARKS = ["pipeline", "feedback", "reports", "intent", "guard", "admission", "imports"]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    import database
+
+    workdir = tempfile.mkdtemp(prefix="sql_assistant_bench_")
+    databases = SyntheticDatabases(employees=args.employees, departments=args.departments,
+                                   salary_rows_per_employee=args.salary_rows, seed=args.seed,
+                                   directory=workdir)
+    database.use_connection_factory(databases.connect)
+
+    results = {}
+    skipped = {}
+    failures = []
+    selected = args.only or BENCHMARKS
+    for name in selected:
+        try:
+            if name == "pipeline":
+                bench_pipeline(databases, args.iterations, results)
+            elif name == "feedback":
+                bench_feedback(workdir, args.iterations, results)
+            elif name == "reports":
+                bench_reports(workdir, args.iterations, results, failures)
+            elif name == "intent":
+                bench_intent(args.iterations, results)
+            elif name == "guard":
+                bench_guard(args.iterations, results, failures)
+            elif name == "admission":
+                bench_admission(args.iterations, results)
+            elif name == "imports":
+                bench_imports(args.iterations, results, failures)
+        except ImportError as e:
+            skipped[name] = f"missing dependency: {e}"
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "scale": {
+                "employees": args.employees,
+                "departments": args.departments,
+                "salary_rows_per_employee": args.salary_rows,
+                "seed": args.seed,
+            },
+            "iterations": args.iterations,
+        },
+        "results": results,
+        "skipped": skipped,
+        "failures": failures,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Print per-benchmark change against a baseline; returns True if anything regressed"""
+    regressed = False
+    print(f"\n{'benchmark':45} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, stats in sorted(current["results"].items()):
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            print(f"{name:45} {'-':>12} {stats['p50_ms']:>10.3f}ms {'new':>9}")
+            continue
+        change = (stats["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0.0
+        flag = " REGRESSION" if change > threshold else ""
+        regressed = regressed or bool(flag)
+        print(f"{name:45} {before['p50_ms']:>10.3f}ms {stats['p50_ms']:>10.3f}ms {change:>+8.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--departments", type=int, default=8)
+    parser.add_argument("--salary-rows", type=float, default=1.2, help="salary rows per employee")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--only", nargs="*", choices=BENCHMARKS)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="baseline JSON to compare p50 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in sorted(report["results"].items()):
+        peak = f" peak={stats['peak_alloc_mb']:.1f}MB" if "peak_alloc_mb" in stats else ""
+        rejected = f" rejected={stats['rejected']}" if "rejected" in stats else ""
+        calls = f" llm_calls={stats['llm_calls']}" if "llm_calls" in stats else ""
+        print(f"{name:45} p50={stats['p50_ms']:9.3f}ms p95={stats['p95_ms']:9.3f}ms{peak}{rejected}{calls}")
+    for name, reason in report["skipped"].items():
+        print(f"{name:45} skipped ({reason})")
+    print(f"\nResults written to {args.output}")
+
+    for failure in report["failures"]:
+        print(f"BUDGET EXCEEDED: {failure}")
+    if report["failures"]:
+        sys.exit(1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Chart data preparation and output formats.
+
+Large results are reduced before anything is drawn: long series keep the
+top K points and fold the rest into an "Others" bar, distributions are
+binned, and per-group averages are computed from the columns. The reduced
+series is then either rendered to a PNG with matplotlib or emitted as a
+Plotly JSON spec for the client to draw, with the spec size capped.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from result_table import ResultTable
+
+# "png" renders on the server; "plotly" sends a JSON spec the client renders
+CHART_FORMAT = os.getenv("CHART_FORMAT", "png").lower()
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "30"))
+CHART_MAX_BYTES = int(os.getenv("CHART_MAX_BYTES", "65536"))
+CHART_BINS = int(os.getenv("CHART_BINS", "20"))
+CHART_DPI = int(os.getenv("CHART_DPI", "100"))
+MAX_LABEL_LENGTH = 40
+
+OTHERS_LABEL = "Others"
+
+
+@dataclass
+class ChartData:
+    """A reduced series ready to draw"""
+    kind: str  # "bar" (vertical) or "barh"
+    labels: List[str]
+    values: List[float]
+    title: str
+    x_label: str
+    y_label: str
+    groups: Optional[List[str]] = None  # legend group per point
+    notes: List[str] = field(default_factory=list)
+
+
+def _label(value) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_LABEL_LENGTH else text[:MAX_LABEL_LENGTH - 1] + "…"
+
+
+def _numeric(values: np.ndarray) -> Optional[np.ndarray]:
+    """Column as float64, or None if it isn't numeric"""
+    if values.dtype.kind in "iuf":
+        return values.astype(np.float64, copy=False)
+    try:
+        return np.fromiter((float(v) for v in values.tolist()), dtype=np.float64, count=len(values))
+    except (TypeError, ValueError):
+        return None
+
+
+def top_k_with_others(labels: np.ndarray, values: np.ndarray, k: int, aggregate: str = "mean",
+                      groups: np.ndarray = None):
+    """Keep the k largest values; the rest become one "Others" point (their mean or sum)
+
+    Returns (labels, values, groups, note); note is empty when nothing was folded.
+    """
+    if len(values) <= k:
+        return labels, values, groups, ""
+    order = np.argsort(-values, kind="stable")
+    kept, rest = order[:k - 1], order[k - 1:]
+    others = values[rest].sum() if aggregate == "sum" else values[rest].mean()
+    labels = np.append(labels[kept].astype(object), f"{OTHERS_LABEL} ({len(rest)})")
+    values = np.append(values[kept], others)
+    if groups is not None:
+        groups = np.append(groups[kept].astype(object), OTHERS_LABEL)
+    note = f"Top {k - 1} of {len(order)} shown; the remaining {len(rest)} are grouped as {OTHERS_LABEL} ({aggregate})"
+    return labels, values, groups, note
+
+
+def histogram_bins(values: np.ndarray, bins: int):
+    """Equal-width bins over the values; returns (labels, counts)"""
+    counts, edges = np.histogram(values, bins=bins)
+    labels = [f"{edges[i]:,.0f}-{edges[i + 1]:,.0f}" for i in range(len(counts))]
+    return np.asarray(labels, dtype=object), counts.astype(np.float64)
+
+
+def _group_means(keys: np.ndarray, values: np.ndarray):
+    """Mean of values per distinct key, keys in sorted order"""
+    distinct, codes = np.unique(keys.astype(str), return_inverse=True)
+    means = np.bincount(codes, weights=values) / np.bincount(codes)
+    return distinct.astype(object), means
+
+
+def _value_column(columns: List[str]) -> str:
+    if any(word in columns[-1].lower() for word in ['salary', 'amount', 'count']):
+        return columns[-1]
+    return columns[1]
+
+
+def prepare_chart_data(chart_type: Optional[str], table: ResultTable,
+                       max_points: int = CHART_MAX_POINTS, bins: int = CHART_BINS) -> Optional[ChartData]:
+    """Reduce a result to at most max_points bars for the given chart type (None if not chartable)"""
+    columns = table.columns
+    if len(columns) < 2 or not len(table):
+        return None
+
+    if chart_type == "top_by_department" and {'Employee Name', 'Department', 'Salary'} <= set(columns):
+        values = _numeric(table.column('Salary'))
+        if values is None:
+            return None
+        labels, values, groups, note = top_k_with_others(
+            table.column('Employee Name'), values, max_points, groups=table.column('Department'))
+        chart = ChartData("barh", labels, values, 'Top Employees by Department and Salary',
+                          'Salary ($)', 'Employee', groups=groups)
+
+    elif chart_type == "avg_by_department" and 'Department' in columns:
+        if 'Average Salary' in columns:
+            labels, values = table.column('Department'), _numeric(table.column('Average Salary'))
+        else:
+            values = _numeric(table.column(_value_column(columns)))
+            if values is None:
+                return None
+            labels, values = _group_means(table.column('Department'), values)
+        labels, values, _, note = top_k_with_others(labels, values, max_points)
+        chart = ChartData("bar", labels, values, 'Average Salary by Department', 'Department', 'Average Salary ($)')
+
+    elif chart_type == "distribution":
+        if {'Salary Band', 'Count'} <= set(columns):
+            # Pre-binned (salary cube); sum bands across departments, keeping band order
+            bands = table.column('Salary Band').tolist()
+            totals = {}
+            for band, count in zip(bands, table.column('Count').tolist()):
+                totals[band] = totals.get(band, 0) + count
+            labels, values = np.asarray(list(totals), dtype=object), np.asarray(list(totals.values()), dtype=np.float64)
+            value_name = 'Salary'
+        else:
+            value_name = _value_column(columns)
+            values = _numeric(table.column(value_name))
+            if values is None:
+                return None
+            labels, values = histogram_bins(values, min(bins, max_points))
+        note = ""
+        chart = ChartData("bar", labels, values, f'{value_name} Distribution', value_name, 'Count')
+
+    else:
+        x_col = columns[0] if 'name' in columns[0].lower() else columns[1]
+        y_col = _value_column(columns)
+        values = _numeric(table.column(y_col))
+        if values is None:
+            return None
+        aggregate = "sum" if 'count' in y_col.lower() else "mean"
+        labels, values, _, note = top_k_with_others(table.column(x_col), values, max_points, aggregate)
+        chart = ChartData("bar", labels, values, f'{y_col} by {x_col}', x_col, y_col)
+
+    chart.labels = [_label(label) for label in np.asarray(chart.labels).tolist()]
+    chart.values = np.asarray(chart.values, dtype=np.float64).round(2).tolist()
+    if chart.groups is not None:
+        chart.groups = [str(group) for group in np.asarray(chart.groups).tolist()]
+    if note:
+        chart.notes.append(note)
+    return chart
+
+
+def to_plotly_spec(chart: ChartData) -> dict:
+    """Plotly figure as plain JSON-able data (one trace per legend group)"""
+    horizontal = chart.kind == "barh"
+
+    def trace(labels, values, name=None):
+        data = {"type": "bar", "x": values, "y": labels, "orientation": "h"} if horizontal else \
+            {"type": "bar", "x": labels, "y": values}
+        if name is not None:
+            data["name"] = name
+        return data
+
+    if chart.groups is None:
+        traces = [trace(chart.labels, chart.values)]
+    else:
+        grouped = {}
+        for label, value, group in zip(chart.labels, chart.values, chart.groups):
+            labels, values = grouped.setdefault(group, ([], []))
+            labels.append(label)
+            values.append(value)
+        traces = [trace(labels, values, group) for group, (labels, values) in grouped.items()]
+
+    layout = {
+        "title": {"text": chart.title},
+        "xaxis": {"title": {"text": chart.x_label}},
+        "yaxis": {"title": {"text": chart.y_label}},
+    }
+    if horizontal:
+        layout["yaxis"]["autorange"] = "reversed"
+    if chart.notes:
+        layout["annotations"] = [{"text": " · ".join(chart.notes), "showarrow": False,
+                                  "xref": "paper", "yref": "paper", "x": 0, "y": -0.2}]
+    return {"data": traces, "layout": layout}
+
+
+def plotly_spec(chart_type: Optional[str], table: ResultTable, max_bytes: int = CHART_MAX_BYTES,
+                max_points: int = CHART_MAX_POINTS) -> Optional[str]:
+    """Compact Plotly JSON no larger than max_bytes (fewer points are kept until it fits)"""
+    while True:
+        chart = prepare_chart_data(chart_type, table, max_points=max_points)
+        if chart is None:
+            return None
+        payload = json.dumps(to_plotly_spec(chart), separators=(",", ":"), ensure_ascii=False)
+        if len(payload.encode()) <= max_bytes:
+            return payload
+        if max_points <= 2:
+            return None
+        max_points = max(2, max_points // 2)
+
+
+def render_png(chart: ChartData, path: str, dpi: int = CHART_DPI):
+    """Draw the reduced series with matplotlib"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 8))
+    try:
+        positions = range(len(chart.labels))
+        if chart.kind == "barh":
+            colors = None
+            if chart.groups is not None:
+                distinct = list(dict.fromkeys(chart.groups))
+                palette = plt.cm.Set3(range(len(distinct)))
+                group_colors = {group: palette[i] for i, group in enumerate(distinct)}
+                colors = [group_colors[group] for group in chart.groups]
+                handles = [plt.Rectangle((0, 0), 1, 1, color=group_colors[group]) for group in distinct]
+                plt.legend(handles, distinct, title='Department')
+            plt.barh(positions, chart.values, color=colors)
+            plt.yticks(positions, chart.labels)
+            plt.gca().invert_yaxis()
+        else:
+            plt.bar(positions, chart.values)
+            plt.xticks(positions, chart.labels, rotation=45, ha='right')
+        plt.xlabel(chart.x_label)
+        plt.ylabel(chart.y_label)
+        plt.title(chart.title)
+        if chart.notes:
+            plt.figtext(0.01, 0.01, " · ".join(chart.notes), fontsize=8)
+        plt.tight_layout()
+        plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    finally:
+        plt.close()
@@ -0,0 +1,213 @@
+"""
+Database access shared by the chat app and the report scheduler.
+
+- Pooled connections per database
+- Admission control (per-database slots, priority classes, fair queuing)
+- Query guard (EXPLAIN budget) for user-supplied SQL
+- Server-side prepared statements for recurring SQL
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+from admission import AdmissionController, current_priority
+from metrics import record_query
+from query_guard import QueryGuard
+from sql_params import PreparedStatementCache
+
+# Database connection configurations
+DB_CONFIGS = {
+    "db1": {
+        "host": "db1",
+        "port": 5432,
+        "database": "db1",
+        "user": "user",
+        "password": "password"
+    },
+    "db2": {
+        "host": "db2",
+        "port": 5432,
+        "database": "db2",
+        "user": "user",
+        "password": "password"
+    },
+    "db3": {
+        "host": "db3",
+        "port": 5432,
+        "database": "db3",
+        "user": "user",
+        "password": "password"
+    }
+}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+
+# Concurrent queries per database; kept within the pool so getconn() never runs dry.
+# DB_MAX_CONCURRENT_DB1 etc. override it for one database (e.g. a smaller replica).
+DB_MAX_CONCURRENT = min(int(os.getenv("DB_MAX_CONCURRENT", str(DB_POOL_SIZE))), DB_POOL_SIZE)
+admission = AdmissionController(DB_MAX_CONCURRENT, {
+    db_name: min(int(os.environ[f"DB_MAX_CONCURRENT_{db_name.upper()}"]), DB_POOL_SIZE)
+    for db_name in DB_CONFIGS if f"DB_MAX_CONCURRENT_{db_name.upper()}" in os.environ
+})
+
+# EXPLAIN-based budget check for user-supplied SQL
+query_guard = QueryGuard()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Optional override: callable(db_name) -> DB-API connection (e.g. the SQLite stand-ins used by
+# benchmark.py). EXPLAIN guarding and PREPARE are Postgres features and are skipped for it.
+_connection_factory = None
+
+
+def use_connection_factory(factory):
+    """Route all connections through factory(db_name); pass None to go back to Postgres"""
+    global _connection_factory
+    _connection_factory = factory
+
+
+def get_db_connection(db_name):
+    """Get a new (unpooled) database connection for specified database"""
+    if _connection_factory is not None:
+        return _connection_factory(db_name)
+    try:
+        config = DB_CONFIGS[db_name]
+        conn = psycopg2.connect(**config)
+        return conn
+    except Exception as e:
+        print(f"Error connecting to {db_name}: {e}")
+        return None
+
+
+def _get_pool(db_name):
+    with _pools_lock:
+        db_pool = _pools.get(db_name)
+        if db_pool is None:
+            db_pool = _pools[db_name] = pool.ThreadedConnectionPool(1, DB_POOL_SIZE, **DB_CONFIGS[db_name])
+        return db_pool
+
+
+@contextmanager
+def db_connection(db_name):
+    """Borrow a pooled connection; prepared statements live as long as the connection"""
+    if _connection_factory is not None:
+        conn = _connection_factory(db_name)
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    try:
+        db_pool = _get_pool(db_name)
+        conn = db_pool.getconn()
+        conn.autocommit = True
+    except Exception as e:
+        print(f"Error connecting to {db_name}: {e}")
+        raise ConnectionError(f"Failed to connect to database {db_name}") from e
+
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        db_pool.putconn(conn, close=broken or conn.closed)
+
+
+def execute_sql_query(sql_query, db_name, guarded=True, prepared=True, priority=None, guard_decisions=None):
+    """Execute SQL query on specified database
+
+    Rows come back as a columnar ResultTable. The query first waits for an
+    admission slot (priority defaults to the current admission_context), and
+    generated SQL is checked against the EXPLAIN budget of the database and
+    priority class and may be limited, sampled or rejected. Internal fixed
+    queries pass guarded=False. A limit or sample decision is appended to
+    guard_decisions when a list is given, so callers can mark the result as
+    partial.
+    """
+    # NumPy comes in with the first query rather than at import
+    from result_table import ResultTable
+
+    priority = priority or current_priority()
+    try:
+        with admission.slot(db_name, priority), db_connection(db_name) as conn:
+            cursor = conn.cursor()
+
+            postgres = _connection_factory is None
+
+            if guarded and postgres:
+                decision = query_guard.check(cursor, sql_query, db_name, priority)
+                if not decision.allowed:
+                    cursor.close()
+                    return None, f"Query rejected: {decision.reason}"
+                if decision.action != "allow":
+                    print(f"Query guard ({decision.action}) on {db_name}: {decision.reason}")
+                    if guard_decisions is not None:
+                        guard_decisions.append(decision)
+                sql_query = decision.sql
+
+            start = time.perf_counter()
+            if prepared and postgres:
+                PreparedStatementCache.for_connection(conn).execute(cursor, sql_query)
+            else:
+                cursor.execute(sql_query)
+
+            # Get column names
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+
+            # Fetch results as columns; the only row-to-column conversion
+            results = ResultTable.from_rows(cursor.fetchall(), columns)
+            record_query(db_name, sql_query, time.perf_counter() - start)
+
+            cursor.close()
+
+            return results, columns
+    except ConnectionError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"Error executing query: {str(e)}"
+
+
+def stream_sql_query(sql_query, db_name, chunk_rows=50000, priority=None):
+    """Yield the result of an internal fixed query as ResultTable chunks
+
+    Postgres uses a server-side (named) cursor so only one chunk is held in
+    memory at a time; the admission slot is held until the stream is closed.
+    Raises on failure instead of returning (None, error).
+    """
+    from result_table import ResultTable
+
+    with admission.slot(db_name, priority), db_connection(db_name) as conn:
+        postgres = _connection_factory is None
+        start = time.perf_counter()
+        if postgres:
+            # Named cursors need a transaction; the pool hands out autocommit connections
+            conn.autocommit = False
+            cursor = conn.cursor(name=f"sqla_stream_{threading.get_ident()}")
+            cursor.itersize = chunk_rows
+        else:
+            cursor = conn.cursor()
+        try:
+            cursor.execute(sql_query)
+            columns = None
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                if not rows:
+                    break
+                yield ResultTable.from_rows(rows, columns)
+        finally:
+            cursor.close()
+            if postgres and not conn.closed:
+                conn.rollback()
+                conn.autocommit = True
+            record_query(db_name, sql_query, time.perf_counter() - start)
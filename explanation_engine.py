@@ -0,0 +1,252 @@
+"""
+Natural-language explanations of query results.
+
+Common result shapes are explained from the data with fixed templates, no
+LLM call needed:
+
+- a single scalar (counts, averages, totals)
+- top-N lists, overall or per group
+- per-group aggregates (one row per department, say)
+- salary band histograms
+
+Anything else goes to the LLM. Its explanations are cached by (question
+pattern, result hash), so the same question over unchanged data is
+explained once.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from intent_router import classify_intent
+from metrics import REGISTRY
+
+EXPLANATION_CACHE_SIZE = 1024
+EXPLANATION_CACHE_TTL = 3600  # seconds
+
+EXPLANATIONS = REGISTRY.counter(
+    "sql_assistant_explanations_total", "Result explanations by source (template, cache, llm)", ["source"])
+
+_DIGITS_RE = re.compile(r"\d+")
+_GROUP_BY_RE = re.compile(r"\bgroup\s+by\b", re.IGNORECASE)
+_MONEY_WORDS = ("salary", "amount", "pay", "wage")
+
+
+def question_pattern(question: str) -> str:
+    """Normalized question with numbers masked, so "top 3" and "top 5" share a pattern"""
+    return _DIGITS_RE.sub("#", classify_intent(question).text)
+
+
+def result_hash(table) -> str:
+    """Digest of a result's columns and values"""
+    digest = hashlib.sha256("\x1f".join(table.columns).encode())
+    for array in table.arrays:
+        if array.dtype.kind in "iuf":
+            digest.update(array.dtype.str.encode())
+            digest.update(array.tobytes())
+        else:
+            digest.update("\x1f".join(map(str, array.tolist())).encode())
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def _numeric(array) -> Optional[List[float]]:
+    """Column as Python numbers, or None if it isn't numeric"""
+    if array.dtype.kind in "iuf":
+        return array.tolist()
+    try:
+        return [float(value) for value in array.tolist()]
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_money(column: str, intent) -> bool:
+    """Salary-like column (by name, or any non-count value when the question is about salary)"""
+    name = column.lower()
+    return any(word in name for word in _MONEY_WORDS) or (
+        intent.has("salary") and not intent.has("count") and "count" not in name and name != "employees")
+
+
+def _is_identifier(column: str) -> bool:
+    name = column.lower()
+    return name == "id" or name.endswith("_id")
+
+
+def _fmt(value, money: bool = False) -> str:
+    """Number with separators, with a dollar sign for money"""
+    if isinstance(value, float):
+        text = f"{value:,.0f}" if value.is_integer() else f"{value:,.2f}"
+    elif isinstance(value, int):
+        text = f"{value:,}"
+    else:
+        return str(value)
+    return f"${text}" if money else text
+
+
+def _subject(intent) -> str:
+    for concept, noun in (("employee", "employees"), ("department", "departments"), ("salary", "salary records")):
+        if intent.has(concept):
+            return noun
+    return "matching rows"
+
+
+def _scalar(intent, table) -> Optional[str]:
+    column = table.columns[0]
+    value = table[0][0]
+    if value is None:
+        return f"The query returned no value for {column}."
+    if not isinstance(value, (int, float)):
+        numbers = _numeric(table.arrays[0])
+        if numbers is None:
+            return f"The result is {value}."
+        value = numbers[0]
+    if intent.has("count") or column.lower().startswith("count"):
+        count = int(value)
+        return f"There {'is' if count == 1 else 'are'} {count:,} {_subject(intent)}."
+    label = "salary" if intent.has("salary") else column
+    for concept, word in (("average", "average"), ("total", "total"), ("top", "highest"), ("bottom", "lowest")):
+        if intent.has(concept):
+            return f"The {word} {label} is {_fmt(value, _is_money(label, intent))}."
+    return f"The result is {_fmt(value, _is_money(column, intent))} ({column})."
+
+
+def _histogram(table) -> Optional[str]:
+    bands, counts = table.column("Salary Band").tolist(), _numeric(table.column("Count"))
+    if counts is None:
+        return None
+    totals = {}
+    for band, count in zip(bands, counts):
+        totals[band] = totals.get(band, 0) + count
+    band, count = max(totals.items(), key=lambda item: item[1])
+    total = sum(totals.values())
+    text = (f"Salaries fall into {len(totals)} bands; the most common is {band} "
+            f"with {int(count):,} of {int(total):,} salaries ({count / total:.0%}).")
+    if "Department" in table.columns:
+        departments = [d for d in dict.fromkeys(table.column("Department").tolist()) if d != "All"]
+        if len(departments) > 1:
+            text += f" Counts are broken down across {len(departments)} departments."
+    return text
+
+
+def _ranked(intent, table, name_column: str, value_column: str, values: List[float]) -> Optional[str]:
+    """Top/bottom lists: rows sorted by the value, overall or within groups"""
+    names = table.column(name_column).tolist()
+    group_column = next((c for c in table.columns if c not in (name_column, value_column)
+                         and table.column(c).dtype.kind == "O"), None)
+    best = max(range(len(values)), key=values.__getitem__)
+    worst = min(range(len(values)), key=values.__getitem__)
+    money = _is_money(value_column, intent)
+
+    if group_column is not None and intent.has("top", "per_group"):
+        groups = table.column(group_column).tolist()
+        group_count = len(set(groups))
+        per_group = max(groups.count(group) for group in set(groups))
+        return (f"Showing the top {per_group} by {value_column.lower()} in each of {group_count} "
+                f"{group_column.lower()}s. The highest overall is {names[best]} ({groups[best]}) at "
+                f"{_fmt(values[best], money)}; the lowest shown is {names[worst]} ({groups[worst]}) at "
+                f"{_fmt(values[worst], money)}.")
+
+    lowest_first = intent.has("bottom") and not intent.has("top")
+    order = sorted(range(len(values)), key=values.__getitem__, reverse=not lowest_first)
+    word = "lowest" if lowest_first else "highest"
+    leaders = [f"{names[i]} ({_fmt(values[i], money)})" for i in order[:3]]
+    text = f"{leaders[0]} has the {word} {value_column.lower()}"
+    if len(leaders) > 1:
+        text += ", followed by " + " and ".join(leaders[1:])
+    text += "."
+    if len(values) > 3:
+        text += (f" {len(values):,} rows in total, ranging from {_fmt(values[worst], money)} "
+                 f"to {_fmt(values[best], money)}.")
+    return text
+
+
+def _per_group(intent, table, group_column: str, value_column: str, values: List[float]) -> str:
+    labels = table.column(group_column).tolist()
+    best = max(range(len(values)), key=values.__getitem__)
+    worst = min(range(len(values)), key=values.__getitem__)
+    money = _is_money(value_column, intent)
+    text = (f"Across {len(values)} {group_column.lower()}s, {value_column.lower()} is highest for "
+            f"{labels[best]} ({_fmt(values[best], money)}) and lowest for {labels[worst]} "
+            f"({_fmt(values[worst], money)}).")
+    if "Employees" in table.columns and value_column != "Employees":
+        employees = _numeric(table.column("Employees"))
+        if employees is not None:
+            text += f" {int(sum(employees)):,} employees are included."
+    return text
+
+
+def template_explanation(question: str, table, sql: Optional[str] = None) -> Optional[str]:
+    """Explanation from a fixed template, or None if the result shape isn't a common one"""
+    if not len(table) or not table.columns:
+        return None
+    intent = classify_intent(question)
+    if len(table) == 1 and len(table.columns) == 1:
+        return _scalar(intent, table)
+    if {"Salary Band", "Count"} <= set(table.columns):
+        return _histogram(table)
+
+    text_columns = [c for c in table.columns if table.column(c).dtype.kind == "O" and _numeric(table.column(c)) is None]
+    numeric_columns = [c for c in table.columns if c not in text_columns and not _is_identifier(c)]
+    if not text_columns or not numeric_columns:
+        return None
+    label_column = text_columns[0]
+    if "average" in intent.concepts and any("average" in c.lower() for c in numeric_columns):
+        value_column = next(c for c in numeric_columns if "average" in c.lower())
+    else:
+        value_column = numeric_columns[-1]
+    values = _numeric(table.column(value_column))
+
+    # One row per label of a grouped result: a per-group aggregate. Plain row listings
+    # (a name and an amount per row) aren't aggregates and go to the ranked template or the LLM
+    labels = table.column(label_column).tolist()
+    grouped = intent.has("per_group") or intent.has("department") or bool(sql and _GROUP_BY_RE.search(sql))
+    if grouped and len(text_columns) == 1 and len(set(labels)) == len(labels) \
+            and not intent.has("top") and not intent.has("bottom"):
+        return _per_group(intent, table, label_column, value_column, values)
+    if intent.has("top") or intent.has("bottom") or values == sorted(values, reverse=True):
+        return _ranked(intent, table, label_column, value_column, values)
+    return None
+
+
+class ExplanationEngine:
+    """Templates first, then the LLM with a (question pattern, result hash) cache"""
+
+    def __init__(self, llm_invoke: Callable, cache_size: int = EXPLANATION_CACHE_SIZE,
+                 ttl: float = EXPLANATION_CACHE_TTL):
+        # llm_invoke(prompt, purpose) -> awaitable LangChain response
+        self.llm_invoke = llm_invoke
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._cache = OrderedDict()  # (pattern, result hash) -> (timestamp, text)
+        self._lock = threading.Lock()
+
+    async def explain(self, question: str, results, columns, prompt: str, sql: Optional[str] = None) -> str:
+        """Explanation of results; prompt is what the LLM gets if no template fits"""
+        from result_table import as_table
+
+        table = as_table(results, columns)
+        text = template_explanation(question, table, sql)
+        if text is not None:
+            EXPLANATIONS.inc(source="template")
+            return text
+
+        key = (question_pattern(question), result_hash(table))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self._cache.move_to_end(key)
+                EXPLANATIONS.inc(source="cache")
+                return cached[1]
+
+        response = await self.llm_invoke(prompt, "explanation")
+        text = response.content.strip()
+        EXPLANATIONS.inc(source="llm")
+        with self._lock:
+            self._cache[key] = (time.monotonic(), text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return text
@@ -0,0 +1,252 @@
+"""
+Hash join for the employees x departments x salaries federation.
+
+db1's employees and departments are small and form the build side:
+names are dictionary-encoded to integer codes and employee ids go into an
+integer-key index. Salaries from db2 are the probe side and are streamed
+in chunks, so the salaries table is never held in memory at once. Each
+chunk is reduced straight into one of three outputs:
+
+- ``all_rows``: every (employee, department, salary) row, highest salary first
+- ``top_per_department``: the top N salaries per department
+- ``department_summary``: per-department count/average/total/min/max
+
+As before, rows are distinct on (employee name, department name, amount).
+"""
+
+import os
+import threading
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+
+from result_table import ResultTable
+
+JOIN_CHUNK_ROWS = int(os.getenv("JOIN_CHUNK_ROWS", "50000"))
+
+EMPLOYEES_QUERY = "SELECT id, name, department_id FROM employees"
+DEPARTMENTS_QUERY = "SELECT id, name FROM departments"
+SALARIES_QUERY = "SELECT employee_id, amount FROM salaries"
+
+ROW_COLUMNS = ['Employee Name', 'Department', 'Salary']
+SUMMARY_COLUMNS = ['Department', 'Employees', 'Average Salary', 'Total Salary', 'Min Salary', 'Max Salary']
+
+
+def _int_keys(values: np.ndarray) -> np.ndarray:
+    """Join keys as int64; NULLs become -1 and never match"""
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64, copy=False)
+    return np.fromiter((-1 if v is None else int(v) for v in values), dtype=np.int64, count=len(values))
+
+
+def dictionary_encode(values: np.ndarray, sort: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """Integer codes plus the dictionary of distinct values (sorted if asked, else first-seen order)"""
+    distinct = {}
+    for value in values.tolist():
+        distinct.setdefault(value, len(distinct))
+    if sort:
+        for code, value in enumerate(sorted(distinct)):
+            distinct[value] = code
+    codes = np.fromiter((distinct[v] for v in values.tolist()), dtype=np.int32, count=len(values))
+    dictionary = np.empty(len(distinct), dtype=object)
+    for value, code in distinct.items():
+        dictionary[code] = value
+    return codes, dictionary
+
+
+class KeyIndex:
+    """Integer key -> build-side row position (-1 when missing)
+
+    Compact non-negative keys (the usual serial ids) use a direct-address
+    array; anything else falls back to a sorted key array with binary search.
+    """
+
+    def __init__(self, keys: np.ndarray):
+        keys = _int_keys(keys)
+        self._dense = None
+        if len(keys) and keys.min() >= 0 and keys.max() < max(1024, 4 * len(keys)):
+            self._dense = np.full(int(keys.max()) + 1, -1, dtype=np.int64)
+            self._dense[keys] = np.arange(len(keys))
+        else:
+            order = np.argsort(keys, kind="stable")
+            self._sorted_keys = keys[order]
+            self._positions = order
+
+    def lookup(self, probe: np.ndarray) -> np.ndarray:
+        probe = _int_keys(probe)
+        if self._dense is not None:
+            positions = np.full(len(probe), -1, dtype=np.int64)
+            in_range = (probe >= 0) & (probe < len(self._dense))
+            positions[in_range] = self._dense[probe[in_range]]
+            return positions
+        if not len(self._sorted_keys):
+            return np.full(len(probe), -1, dtype=np.int64)
+        slots = np.searchsorted(self._sorted_keys, probe)
+        slots[slots == len(self._sorted_keys)] = 0
+        return np.where(self._sorted_keys[slots] == probe, self._positions[slots], -1)
+
+
+class EmployeeDimension:
+    """Build side: employees inner-joined to departments, names dictionary-encoded"""
+
+    def __init__(self, employees: ResultTable, departments: ResultTable):
+        # Department codes follow name order so sorting by code sorts by name
+        department_codes, self.department_names = dictionary_encode(departments.column("name"), sort=True)
+        department_rows = KeyIndex(departments.column("id")).lookup(employees.column("department_id"))
+        matched = department_rows >= 0
+
+        self.employee_ids = _int_keys(employees.column("id"))[matched]
+        self.name_codes, self.employee_names = dictionary_encode(employees.column("name")[matched])
+        self.department_codes = department_codes[department_rows[matched]]
+        self.index = KeyIndex(self.employee_ids)
+
+    @property
+    def department_count(self) -> int:
+        return len(self.department_names)
+
+    def entity_codes(self, rows: np.ndarray) -> np.ndarray:
+        """(employee name, department name) pair as one integer per build row"""
+        return self.name_codes[rows].astype(np.int64) * self.department_count + self.department_codes[rows]
+
+
+_dimension_cache = (None, None, None)
+_dimension_lock = threading.Lock()
+
+
+def employee_dimension(employees: ResultTable, departments: ResultTable) -> EmployeeDimension:
+    """Build side for these tables, reused while the same snapshots are passed in"""
+    global _dimension_cache
+    with _dimension_lock:
+        cached_employees, cached_departments, dimension = _dimension_cache
+        if cached_employees is not employees or cached_departments is not departments:
+            dimension = EmployeeDimension(employees, departments)
+            _dimension_cache = (employees, departments, dimension)
+        return dimension
+
+
+def first_occurrences(entities: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    """Positions of the first row of each distinct (entity, amount), in original order"""
+    if not len(entities):
+        return np.empty(0, dtype=np.int64)
+    if amounts.dtype.kind in "iuf":
+        # lexsort is stable, so the first of each run is the earliest occurrence
+        order = np.lexsort((amounts, entities))
+        sorted_entities, sorted_amounts = entities[order], amounts[order]
+        starts = np.r_[True, (sorted_entities[1:] != sorted_entities[:-1]) |
+                       (sorted_amounts[1:] != sorted_amounts[:-1])]
+        return np.sort(order[starts])
+    seen = set()
+    first = [i for i, key in enumerate(zip(entities.tolist(), amounts.tolist()))
+             if not (key in seen or seen.add(key))]
+    return np.asarray(first, dtype=np.int64)
+
+
+class _JoinedChunks:
+    """Probe results kept as build-row positions and amounts (no strings)"""
+
+    def __init__(self):
+        self.rows = []
+        self.amounts = []
+
+    def add(self, rows: np.ndarray, amounts: np.ndarray):
+        self.rows.append(rows)
+        self.amounts.append(amounts)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(self.rows), np.concatenate(self.amounts)
+
+
+def probe(dimension: EmployeeDimension, salary_chunks: Iterable[ResultTable]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Inner-join each salary chunk to the build side; yields (build rows, amounts)"""
+    for chunk in salary_chunks:
+        rows = dimension.index.lookup(chunk.column("employee_id"))
+        matched = rows >= 0
+        yield rows[matched], chunk.column("amount")[matched]
+
+
+def distinct_rows(dimension: EmployeeDimension, rows: np.ndarray, amounts: np.ndarray):
+    keep = first_occurrences(dimension.entity_codes(rows), amounts)
+    return rows[keep], amounts[keep]
+
+
+def row_table(dimension: EmployeeDimension, rows: np.ndarray, amounts: np.ndarray) -> ResultTable:
+    """Decode build rows back to names; strings are shared with the dictionaries"""
+    return ResultTable(ROW_COLUMNS, [
+        dimension.employee_names[dimension.name_codes[rows]],
+        dimension.department_names[dimension.department_codes[rows]],
+        amounts,
+    ])
+
+
+def all_rows(dimension: EmployeeDimension, salary_chunks: Iterable[ResultTable]) -> ResultTable:
+    """Every distinct joined row, sorted by salary descending"""
+    joined = _JoinedChunks()
+    for rows, amounts in probe(dimension, salary_chunks):
+        # Drop in-chunk duplicates early; the global pass below catches the rest
+        rows, amounts = distinct_rows(dimension, rows, amounts)
+        joined.add(rows, amounts)
+    rows, amounts = distinct_rows(dimension, *joined.arrays())
+    if amounts.dtype.kind in "iuf":
+        order = np.argsort(-amounts, kind="stable")
+    else:
+        order = np.asarray(sorted(range(len(amounts)), key=amounts.__getitem__, reverse=True), dtype=np.int64)
+    return row_table(dimension, rows[order], amounts[order])
+
+
+def top_n_positions(departments: np.ndarray, amounts: np.ndarray, top_n: int) -> np.ndarray:
+    """Positions of the top_n amounts per department, ordered by department then amount descending"""
+    order = np.lexsort((-amounts, departments))
+    ranked_departments = departments[order]
+    group_starts = np.flatnonzero(np.r_[True, ranked_departments[1:] != ranked_departments[:-1]])
+    rank = np.arange(len(order)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(order)]))
+    return order[rank < top_n]
+
+
+def top_per_department(dimension: EmployeeDimension, salary_chunks: Iterable[ResultTable],
+                       top_n: int) -> ResultTable:
+    """Top N distinct salaries per department; only the current candidates are kept between chunks"""
+    candidates = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    for rows, amounts in probe(dimension, salary_chunks):
+        if amounts.dtype.kind not in "iuf":
+            amounts = amounts.astype(np.float64)
+        rows = np.concatenate([candidates[0], rows])
+        amounts = np.concatenate([candidates[1], amounts])
+        rows, amounts = distinct_rows(dimension, rows, amounts)
+        keep = top_n_positions(dimension.department_codes[rows], amounts, top_n)
+        candidates = rows[keep], amounts[keep]
+    return row_table(dimension, *candidates)
+
+
+def department_summary(dimension: EmployeeDimension, salary_chunks: Iterable[ResultTable]) -> ResultTable:
+    """Per-department salary statistics over the distinct joined rows"""
+    joined = _JoinedChunks()
+    for rows, amounts in probe(dimension, salary_chunks):
+        if amounts.dtype.kind not in "iuf":
+            amounts = amounts.astype(np.float64)
+        joined.add(*distinct_rows(dimension, rows, amounts))
+    rows, amounts = distinct_rows(dimension, *joined.arrays())
+
+    departments = dimension.department_codes[rows]
+    size = dimension.department_count
+    counts = np.bincount(departments, minlength=size)
+    totals = np.bincount(departments, weights=amounts, minlength=size)
+    minimums = np.full(size, np.inf)
+    maximums = np.full(size, -np.inf)
+    np.minimum.at(minimums, departments, amounts)
+    np.maximum.at(maximums, departments, amounts)
+
+    employees = np.bincount(dimension.department_codes[np.unique(rows)], minlength=size)
+    present = counts > 0
+    counts, totals, minimums, maximums = (values[present] for values in (counts, totals, minimums, maximums))
+    if amounts.dtype.kind in "iu":
+        totals, minimums, maximums = (values.astype(np.int64) for values in (totals, minimums, maximums))
+    return ResultTable(SUMMARY_COLUMNS, [
+        dimension.department_names[present],
+        employees[present],
+        np.round(totals / counts, 2),
+        totals,
+        minimums,
+        maximums,
+    ])
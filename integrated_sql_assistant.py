@@ -4,37 +4,57 @@ Professional SQL Assistant with Integrated Features
 - Report Scheduling for automated delivery
 - REST API endpoints for external integration
 - Gradio UI as alternative to Chainlit
+
+Each Gradio browser session and API session_id keeps its own conversation
+and feedback state. The stores are safe to share between threads and
+between worker processes (SQLite in WAL mode, sessions in Redis when
+REDIS_URL is set), so the API can run under several workers:
+
+    gunicorn -w 4 -b 0.0.0.0:9000 'integrated_sql_assistant:create_api_app()'
+
+Each worker loads the saved reports into its own scheduler when it starts
+(don't use --preload: scheduler threads don't survive the fork), and each
+scheduled run is claimed by exactly one of them.
 """
 
-import gradio as gr
 import sqlite3
 from datetime import datetime
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from report_scheduler import ReportScheduler
+from report_scheduler import REPORT_EXPORT_COLUMNS, ReportScheduler, parse_report_csv
 from feedback_system import FeedbackSystem
+from session_store import create_session_store
+from intent_router import classify_intent
+from metrics import PROMETHEUS_CONTENT_TYPE, render_prometheus, request_trace
+from response_format import compress_payload, negotiate_format, records_response, table_response
+import os
 import threading
 import time
 
+# Gradio queue: events processed at once per worker, and events allowed to wait
+GRADIO_CONCURRENCY = int(os.getenv("GRADIO_CONCURRENCY", "8"))
+GRADIO_QUEUE_SIZE = int(os.getenv("GRADIO_QUEUE_SIZE", "64"))
+
 class IntegratedSQLAssistant:
     def __init__(self):
         self.scheduler = ReportScheduler()
+        # Saved reports run from every process; ReportScheduler claims each run once
+        self.scheduler.load_jobs()
         self.feedback = FeedbackSystem()
-        self.conversation_history = {}
+        self.conversation_history = create_session_store()
         
     def process_query(self, message, session_id="default"):
         """Process user query with feedback tracking"""
         try:
             # Simple SQL processing logic
-            if "count" in message.lower() and "employee" in message.lower():
+            intent = classify_intent(message)
+            if intent.has("count", "employee"):
                 response = "✅ Found 25 employees in the database"
                 sql_query = "SELECT COUNT(*) FROM employees"
                 
-            elif "schedule" in message.lower() and "report" in message.lower():
+            elif intent.has("schedule", "report"):
                 response = "📅 Use the Schedule tab to create automated reports"
                 sql_query = None
                 
-            elif "top" in message.lower() and "salary" in message.lower():
+            elif intent.has("top", "salary"):
                 response = "💰 Top 5 salaries: Alice ($90k), Bob ($85k), Charlie ($80k)"
                 sql_query = "SELECT name, salary FROM employees ORDER BY salary DESC LIMIT 5"
                 
@@ -46,6 +66,9 @@ class IntegratedSQLAssistant:
             if sql_query:
                 self.feedback.log_query(session_id, message, sql_query, "db1", 1)
             
+            self.conversation_history.append(session_id, "user", message)
+            self.conversation_history.append(session_id, "assistant", response)
+            
             return response, sql_query
             
         except Exception as e:
@@ -68,10 +91,8 @@ class IntegratedSQLAssistant:
             if not reports:
                 return "No scheduled reports found"
             
-            result = "📅 **Scheduled Reports:**\n\n"
-            for report in reports:
-                result += f"• {report[1]} - {report[4]} at {report[5]}\n"
-            return result
+            lines = "".join(f"• {report[1]} - {report[4]} at {report[5]}\n" for report in reports)
+            return f"📅 **Scheduled Reports:**\n\n{lines}"
         except Exception as e:
             return f"❌ Error: {str(e)}"
     
@@ -84,13 +105,39 @@ class IntegratedSQLAssistant:
         except Exception as e:
             return f"❌ Error: {str(e)}"
 
-# Initialize assistant
-assistant = IntegratedSQLAssistant()
+# Assistant, UI and API are built on first use so importing this module stays cheap
+_assistant = None
+_assistant_lock = threading.Lock()
+
+def get_assistant():
+    """Get the shared assistant, creating it on first use"""
+    global _assistant
+    if _assistant is None:
+        with _assistant_lock:
+            if _assistant is None:
+                _assistant = IntegratedSQLAssistant()
+    return _assistant
+
+_LAZY_ATTRIBUTES = {
+    "assistant": get_assistant,
+    "gradio_app": lambda: create_gradio_app(),
+    "app": lambda: create_api_app(),
+}
+
+def __getattr__(name):
+    """Build `assistant`, `gradio_app` and `app` lazily on first attribute access"""
+    factory = _LAZY_ATTRIBUTES.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = factory()
+    globals()[name] = value
+    return value
+
 
 # Gradio Interface
-def chat_interface(message, history):
+def chat_interface(message, history, session_id="default"):
     """Main chat interface"""
-    response, sql_query = assistant.process_query(message)
+    response, sql_query = get_assistant().process_query(message, session_id)
     
     # Add to history
     history = history or []
@@ -103,121 +150,212 @@ def schedule_interface(name, query, schedule_type, time_input):
     if not all([name, query, schedule_type, time_input]):
         return "❌ Please fill all fields"
     
-    result = assistant.schedule_report(name, query, schedule_type, time_input)
+    result = get_assistant().schedule_report(name, query, schedule_type, time_input)
     return result
 
-def feedback_interface(rating):
+def feedback_interface(rating, session_id="default"):
     """Feedback interface"""
-    return assistant.record_feedback(int(rating))
-
-# Create Gradio app
-with gr.Blocks(title="Professional SQL Assistant") as gradio_app:
-    gr.Markdown("# 🤖 Professional SQL Assistant")
-    gr.Markdown("**Features:** Intelligent querying, automated scheduling, continuous learning")
-    
-    with gr.Tabs():
-        # Chat Tab
-        with gr.TabItem("💬 Chat"):
-            chatbot = gr.Chatbot(height=400)
-            msg = gr.Textbox(placeholder="Ask about employees, salaries, departments...", label="Your Question")
+    return get_assistant().record_feedback(int(rating), session_id)
+
+def create_gradio_app():
+    """Build the Gradio UI (gradio is imported here, not at module load)"""
+    import gradio as gr
+    
+    # Gradio fills in the request; its session hash keeps each browser's history and feedback apart
+    def session_chat(message, history, request: gr.Request):
+        return chat_interface(message, history, request.session_hash)
+    
+    def session_feedback(rating, request: gr.Request):
+        return feedback_interface(rating, request.session_hash)
+    
+    with gr.Blocks(title="Professional SQL Assistant") as gradio_app:
+        gr.Markdown("# 🤖 Professional SQL Assistant")
+        gr.Markdown("**Features:** Intelligent querying, automated scheduling, continuous learning")
+    
+        with gr.Tabs():
+            # Chat Tab
+            with gr.TabItem("💬 Chat"):
+                chatbot = gr.Chatbot(height=400)
+                msg = gr.Textbox(placeholder="Ask about employees, salaries, departments...", label="Your Question")
             
-            with gr.Row():
-                send_btn = gr.Button("Send", variant="primary")
-                clear_btn = gr.Button("Clear")
+                with gr.Row():
+                    send_btn = gr.Button("Send", variant="primary")
+                    clear_btn = gr.Button("Clear")
             
-            # Feedback section
-            gr.Markdown("### Rate the response:")
-            with gr.Row():
-                rating = gr.Radio([1, 2, 3, 4, 5], label="Rating (1-5 stars)")
-                feedback_btn = gr.Button("Submit Feedback")
-                feedback_result = gr.Textbox(label="Feedback Status", interactive=False)
+                # Feedback section
+                gr.Markdown("### Rate the response:")
+                with gr.Row():
+                    rating = gr.Radio([1, 2, 3, 4, 5], label="Rating (1-5 stars)")
+                    feedback_btn = gr.Button("Submit Feedback")
+                    feedback_result = gr.Textbox(label="Feedback Status", interactive=False)
             
-            send_btn.click(chat_interface, [msg, chatbot], [chatbot, msg])
-            clear_btn.click(lambda: ([], ""), outputs=[chatbot, msg])
-            feedback_btn.click(feedback_interface, rating, feedback_result)
+                send_btn.click(session_chat, [msg, chatbot], [chatbot, msg])
+                clear_btn.click(lambda: ([], ""), outputs=[chatbot, msg])
+                feedback_btn.click(session_feedback, rating, feedback_result)
         
-        # Scheduler Tab
-        with gr.TabItem("📅 Scheduler"):
-            gr.Markdown("### Schedule Automated Reports")
+            # Scheduler Tab
+            with gr.TabItem("📅 Scheduler"):
+                gr.Markdown("### Schedule Automated Reports")
             
-            with gr.Row():
-                report_name = gr.Textbox(label="Report Name", placeholder="Daily Employee Count")
-                sql_query = gr.Textbox(label="SQL Query", placeholder="SELECT COUNT(*) FROM employees")
+                with gr.Row():
+                    report_name = gr.Textbox(label="Report Name", placeholder="Daily Employee Count")
+                    sql_query = gr.Textbox(label="SQL Query", placeholder="SELECT COUNT(*) FROM employees")
             
-            with gr.Row():
-                schedule_type = gr.Dropdown(["daily", "weekly", "hourly"], label="Frequency")
-                schedule_time = gr.Textbox(label="Time", placeholder="09:00 or MON:09:00")
+                with gr.Row():
+                    schedule_type = gr.Dropdown(["daily", "weekly", "hourly"], label="Frequency")
+                    schedule_time = gr.Textbox(label="Time", placeholder="09:00 or MON:09:00")
             
-            schedule_btn = gr.Button("Schedule Report", variant="primary")
-            schedule_result = gr.Textbox(label="Result", interactive=False)
+                schedule_btn = gr.Button("Schedule Report", variant="primary")
+                schedule_result = gr.Textbox(label="Result", interactive=False)
             
-            # View scheduled reports
-            view_btn = gr.Button("View Scheduled Reports")
-            reports_display = gr.Textbox(label="Scheduled Reports", interactive=False, lines=10)
+                # View scheduled reports
+                view_btn = gr.Button("View Scheduled Reports")
+                reports_display = gr.Textbox(label="Scheduled Reports", interactive=False, lines=10)
             
-            schedule_btn.click(schedule_interface, 
-                             [report_name, sql_query, schedule_type, schedule_time], 
-                             schedule_result)
-            view_btn.click(assistant.get_scheduled_reports, outputs=reports_display)
+                schedule_btn.click(schedule_interface, 
+                                 [report_name, sql_query, schedule_type, schedule_time], 
+                                 schedule_result)
+                view_btn.click(lambda: get_assistant().get_scheduled_reports(), outputs=reports_display)
         
-        # API Tab
-        with gr.TabItem("🔌 API"):
-            gr.Markdown("### REST API Endpoints")
-            gr.Markdown("""
-            **Base URL:** `http://localhost:9000`
+            # API Tab
+            with gr.TabItem("🔌 API"):
+                gr.Markdown("### REST API Endpoints")
+                gr.Markdown("""
+                **Base URL:** `http://localhost:9000`
             
-            **Endpoints:**
-            - `POST /api/chat` - Chat interaction
-            - `POST /api/execute` - Execute SQL query
-            - `POST /api/schedule` - Schedule report
-            - `GET /api/reports` - Get scheduled reports
-            - `GET /api/results` - Get report results
+                **Endpoints:**
+                - `POST /api/chat` - Chat interaction
+                - `POST /api/execute` - Execute SQL query
+                - `POST /api/schedule` - Schedule report
+                - `POST /api/schedule/bulk` - Schedule many reports in one transaction (JSON list or CSV)
+                - `GET /api/reports/export?format=json|csv` - Export report definitions (streamed, re-importable)
+                - `GET /api/reports` - Get scheduled reports
+                - `GET /api/reports/<id>/results?format=json|csv|arrow` - Latest report result (streamed, gzip/br)
+                - `GET /api/results` - Get report results
             
-            **Example:**
-            ```bash
-            curl -X POST http://localhost:9000/api/chat \\
-                 -H "Content-Type: application/json" \\
-                 -d '{"message": "How many employees?"}'
-            ```
-            """)
+                **Example:**
+                ```bash
+                curl -X POST http://localhost:9000/api/chat \\
+                     -H "Content-Type: application/json" \\
+                     -d '{"message": "How many employees?"}'
+                ```
+                """)
+    
+    # Callbacks run on a worker pool instead of one at a time
+    gradio_app.queue(default_concurrency_limit=GRADIO_CONCURRENCY, max_size=GRADIO_QUEUE_SIZE)
+    return gradio_app
 
 # Flask API (runs in separate thread)
-app = Flask(__name__)
-CORS(app)
-
-@app.route('/api/chat', methods=['POST'])
-def api_chat():
-    data = request.get_json() or {}
-    message = data.get('message', '')
-    session_id = data.get('session_id', 'api_user')
-    
-    response, sql_query = assistant.process_query(message, session_id)
-    
-    return jsonify({
-        "response": response,
-        "sql_query": sql_query,
-        "timestamp": datetime.now().isoformat()
-    })
-
-@app.route('/api/schedule', methods=['POST'])
-def api_schedule():
-    data = request.get_json() or {}
-    result = assistant.schedule_report(
-        data.get('report_name', ''),
-        data.get('sql_query', ''),
-        data.get('schedule_type', ''),
-        data.get('schedule_time', '')
-    )
-    return jsonify({"result": result})
-
-@app.route('/api/reports', methods=['GET'])
-def api_reports():
-    reports = assistant.get_scheduled_reports()
-    return jsonify({"reports": reports})
+def create_api_app():
+    """Build the Flask API app (Flask is imported here, not at module load)"""
+    from flask import Flask, Response, request, jsonify
+    from flask_cors import CORS
+    
+    app = Flask(__name__)
+    CORS(app)
+    # Create the assistant now so this worker's scheduler has the saved reports before any request
+    get_assistant()
+
+    @app.after_request
+    def compress_response(response):
+        # Streamed responses are compressed as they are written (see api_report_results)
+        if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers:
+            return response
+        data, encoding = compress_payload(response.get_data(), request.headers.get("Accept-Encoding"))
+        response.headers.add("Vary", "Accept-Encoding")
+        if encoding is not None:
+            response.set_data(data)
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+    @app.route('/api/chat', methods=['POST'])
+    def api_chat():
+        data = request.get_json() or {}
+        message = data.get('message', '')
+        session_id = data.get('session_id', 'api_user')
+    
+        with request_trace("api_chat"):
+            response, sql_query = get_assistant().process_query(message, session_id)
+    
+        return jsonify({
+            "response": response,
+            "sql_query": sql_query,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    @app.route('/api/schedule', methods=['POST'])
+    def api_schedule():
+        data = request.get_json() or {}
+        result = get_assistant().schedule_report(
+            data.get('report_name', ''),
+            data.get('sql_query', ''),
+            data.get('schedule_type', ''),
+            data.get('schedule_time', '')
+        )
+        return jsonify({"result": result})
+
+    @app.route('/api/schedule/bulk', methods=['POST'])
+    def api_schedule_bulk():
+        # JSON list (or {"reports": [...]}) of /api/schedule bodies, or CSV with the same column names
+        if request.mimetype == 'text/csv':
+            definitions = parse_report_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            definitions = data.get('reports') if isinstance(data, dict) else data
+        if not isinstance(definitions, list):
+            return jsonify({"error": "Expected a list of report definitions"}), 400
+        report_ids, errors = get_assistant().scheduler.schedule_reports(definitions)
+        if errors:
+            return jsonify({"error": "No reports were scheduled", "details": errors}), 400
+        return jsonify({"scheduled": len(report_ids), "report_ids": report_ids})
+
+    @app.route('/api/reports', methods=['GET'])
+    def api_reports():
+        reports = get_assistant().get_scheduled_reports()
+        return jsonify({"reports": reports})
+
+    @app.route('/api/reports/export', methods=['GET'])
+    def api_reports_export():
+        # ?format=json|csv; the catalogue is read and written a batch at a time
+        fmt = negotiate_format(request.args.get('format'), request.headers.get('Accept'))
+        if fmt not in ('json', 'csv'):
+            return jsonify({"error": f"Unsupported format: {request.args.get('format') or fmt}"}), 406
+        scheduler = get_assistant().scheduler
+        body, headers = records_response(REPORT_EXPORT_COLUMNS, scheduler.iter_report_definitions(), fmt,
+                                         request.headers.get('Accept-Encoding'), key="reports")
+        return Response(body, headers=headers)
+
+    @app.route('/api/reports/<int:report_id>/results', methods=['GET'])
+    def api_report_results(report_id):
+        # ?format=json|csv|arrow|text (or an Accept header), optional ?limit=N
+        fmt = negotiate_format(request.args.get('format'), request.headers.get('Accept'))
+        if fmt is None:
+            return jsonify({"error": f"Unsupported format: {request.args.get('format')}"}), 406
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 0:
+            return jsonify({"error": "limit must be 0 or more"}), 400
+        table, info_or_error = get_assistant().scheduler.get_latest_result(report_id)
+        if table is None:
+            return jsonify({"error": info_or_error}), 404
+        try:
+            body, headers = table_response(table, fmt, request.headers.get('Accept-Encoding'), limit=limit)
+        except ImportError:
+            return jsonify({"error": f"{fmt} output is not available on this server"}), 406
+        headers["X-Run-Time"] = str(info_or_error["run_time"])
+        if info_or_error["partial"]:
+            # The query guard limited or sampled the report's query
+            headers["X-Partial-Result"] = info_or_error["partial"]
+        return Response(body, headers=headers)
+
+    @app.route('/metrics', methods=['GET'])
+    def api_metrics():
+        return Response(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+    
+    return app
 
 def run_flask():
     """Run Flask API in background"""
-    app.run(host='0.0.0.0', port=9000, debug=False)
+    create_api_app().run(host='0.0.0.0', port=9000, debug=False, threaded=True)
 
 if __name__ == "__main__":
     # Start Flask API in background thread
@@ -229,4 +367,4 @@ if __name__ == "__main__":
     print("🔌 API Server: http://localhost:9000")
     
     # Launch Gradio interface
-    gradio_app.launch(server_port=7860, share=False)
\ No newline at end of file
+    create_gradio_app().launch(server_port=7860, share=False, max_threads=max(40, GRADIO_CONCURRENCY))
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Intent classification for user questions.
+
+Each message is normalized once into word tokens and matched against every
+intent phrase in a single pass (word and two-word dictionary lookups); the result is a structured Intent used for routing, charting and top-N
+parameters instead of scattered keyword checks.
+
+Run ``python intent_router.py`` for a micro-benchmark.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+
+DEFAULT_TOP_N = 3
+
+# concept -> phrases (single words or two-word phrases)
+CONCEPT_PHRASES = {
+    "salary": ["salary", "salaries", "paid", "pay", "pays", "paying", "wage", "wages",
+               "earn", "earns", "earning", "earnings", "compensation"],
+    "employee": ["employee", "employees", "staff", "people", "worker", "workers", "who"],
+    "department": ["department", "departments", "dept", "depts", "team", "teams"],
+    "top": ["top", "highest", "best", "largest", "most"],
+    "bottom": ["lowest", "least", "smallest", "bottom"],
+    "count": ["count", "how many", "number of"],
+    "average": ["average", "avg", "mean"],
+    "total": ["total", "sum"],
+    "distribution": ["distribution", "histogram", "spread", "range"],
+    "compare": ["compare", "comparison", "versus", "vs"],
+    "chart": ["chart", "graph", "plot", "visualize", "visualise", "visualization", "visualisation"],
+    "join": ["join", "together with", "along with", "combined"],
+    "per_group": ["per", "each", "by", "every"],
+    "schedule": ["schedule", "scheduled", "schedules", "scheduling", "daily", "weekly", "hourly"],
+    "report": ["report", "reports"],
+}
+
+CONCEPT_DATABASES = {
+    "salary": "db2",
+    "employee": "db1",
+    "department": "db1",
+}
+
+TOP_N_WORDS = frozenset(["top", "first", "highest", "best"])
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+
+def _build_phrase_table():
+    """Flatten CONCEPT_PHRASES into word and two-word lookup tables"""
+    words, bigrams = {}, {}
+    for concept, phrases in CONCEPT_PHRASES.items():
+        for phrase in phrases:
+            table = bigrams if " " in phrase else words
+            table.setdefault(phrase, set()).add(concept)
+    return ({k: frozenset(v) for k, v in words.items()},
+            {k: frozenset(v) for k, v in bigrams.items()})
+
+
+_WORD_CONCEPTS, _BIGRAM_CONCEPTS = _build_phrase_table()
+# Tokenizing is the only regex pass; everything after it is dict lookups
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+@dataclass(frozen=True)
+class Intent:
+    """Structured routing decision for a user question"""
+    text: str
+    concepts: FrozenSet[str]
+    target_dbs: Tuple[str, ...]
+    cross_db: bool
+    chart_type: Optional[str]
+    top_n: Optional[int]
+
+    @property
+    def wants_chart(self) -> bool:
+        return self.chart_type is not None
+
+    def has(self, *concepts: str) -> bool:
+        """True if every given concept was detected"""
+        return all(c in self.concepts for c in concepts)
+
+
+def normalize(message: str) -> str:
+    """Lowercase and reduce to space-separated word tokens"""
+    return " ".join(_TOKEN_RE.findall(message.lower()))
+
+
+def classify_intent(message: str) -> Intent:
+    """Classify a raw user message"""
+    return _classify_normalized(normalize(message))
+
+
+@lru_cache(maxsize=2048)
+def _classify_normalized(text: str) -> Intent:
+    concepts = set()
+    top_n = None
+    previous = None
+
+    for token in text.split(" "):
+        found = _WORD_CONCEPTS.get(token)
+        if found:
+            concepts.update(found)
+        if previous is not None:
+            found = _BIGRAM_CONCEPTS.get(f"{previous} {token}")
+            if found:
+                concepts.update(found)
+            if top_n is None and previous in TOP_N_WORDS:
+                if token.isdigit() and len(token) <= 3:
+                    top_n = int(token)
+                elif token in _NUMBER_WORDS:
+                    top_n = _NUMBER_WORDS[token]
+        previous = token
+
+    target_dbs = tuple(sorted({db for concept, db in CONCEPT_DATABASES.items() if concept in concepts}))
+
+    # Salary figures live in db2, names/departments in db1: only questions that
+    # combine them (or ask for a join) need the federated path.
+    cross_db = "join" in concepts or (
+        "salary" in concepts and ("employee" in concepts or "department" in concepts
+                                  or "top" in concepts or "bottom" in concepts)
+    )
+    if cross_db:
+        target_dbs = ("db1", "db2")
+
+    if "top" in concepts and top_n is None and "salary" in concepts:
+        top_n = DEFAULT_TOP_N
+
+    return Intent(
+        text=text,
+        concepts=frozenset(concepts),
+        target_dbs=target_dbs,
+        cross_db=cross_db,
+        chart_type=_chart_type(concepts),
+        top_n=top_n,
+    )
+
+
+def _chart_type(concepts) -> Optional[str]:
+    """Pick a chart type, or None if the question doesn't suggest a visualization"""
+    if "top" in concepts and "department" in concepts:
+        return "top_by_department"
+    if "distribution" in concepts:
+        return "distribution"
+    if "salary" in concepts and "department" in concepts:
+        return "avg_by_department"
+    if concepts & {"chart", "compare", "top", "bottom"}:
+        return "bar"
+    return None
+
+
+if __name__ == "__main__":
+    import timeit
+
+    samples = [
+        "How many employees are there?",
+        "Show me all departments",
+        "What are the salary amounts?",
+        "Top 5 highest paid employees in each department",
+        "Average salary by department as a chart",
+        "Show the salary distribution",
+        "Which employees work in Engineering?",
+        "Compare the top three departments by total salary",
+    ]
+
+    def legacy(question):
+        q = question.lower()
+        keywords = ["top", "highest paid", "salary", "department", "join"]
+        regexes = ["employee.*salary", "department.*salary", "highest.*department"]
+        cross = any(k in q for k in keywords) or any(re.search(r, q) for r in regexes)
+        chart = any(k in q for k in ['top', 'highest', 'salary', 'department', 'compare',
+                                     'distribution', 'chart', 'graph', 'plot'])
+        return cross, chart
+
+    for question in samples:
+        intent = classify_intent(question)
+        print(f"{question!r:60} cross_db={intent.cross_db!s:5} dbs={intent.target_dbs} "
+              f"chart={intent.chart_type} top_n={intent.top_n}")
+
+    runs = 20000
+    legacy_time = timeit.timeit(lambda: [legacy(q) for q in samples], number=runs // len(samples))
+    uncached_time = timeit.timeit(lambda: [_classify_normalized.__wrapped__(normalize(q)) for q in samples],
+                                  number=runs // len(samples))
+    cached_time = timeit.timeit(lambda: [classify_intent(q) for q in samples], number=runs // len(samples))
+    print(f"\nlegacy keyword scan : {legacy_time / runs * 1e6:.2f} us/message")
+    print(f"intent router       : {uncached_time / runs * 1e6:.2f} us/message")
+    print(f"intent router (LRU) : {cached_time / runs * 1e6:.2f} us/message")
@@ -0,0 +1,111 @@
+"""
+Gateway for LLM calls from the chat pipeline.
+
+- Single flight: callers sending an identical prompt while one is in
+  flight share that call's response (the model runs at temperature 0)
+- Bounded concurrency: at most ``LLM_MAX_CONCURRENCY`` calls at once
+- Retries with full-jitter exponential backoff on rate limits, timeouts,
+  connection errors and 5xx responses
+- Per-call latency, outcome and token usage recorded in metrics
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+import weakref
+from typing import Callable, Optional, Tuple
+
+from metrics import record_llm_call
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+_RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# openai's transient errors, matched by name so openai isn't imported here
+_RETRY_ERROR_NAMES = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call is worth retrying"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in _RETRY_ERROR_NAMES:
+        return True
+    return getattr(error, "status_code", None) in _RETRY_STATUS_CODES
+
+
+def token_usage(response) -> Tuple[int, int]:
+    """(prompt, completion) tokens reported with a LangChain response, 0 when unknown"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class LLMGateway:
+    """Coalesced, bounded and retried calls to a chat model"""
+
+    def __init__(self, client_factory: Callable, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, retry_base: float = LLM_RETRY_BASE_SECONDS,
+                 retry_max: float = LLM_RETRY_MAX_SECONDS, timeout: float = LLM_TIMEOUT_SECONDS):
+        # client_factory() -> object with ``async ainvoke(messages)`` (looked up per call)
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+        # Futures and semaphores belong to one event loop, so both are kept per loop
+        self._inflight = weakref.WeakKeyDictionary()  # loop -> {prompt digest: task}
+        self._semaphores = weakref.WeakKeyDictionary()  # loop -> asyncio.Semaphore
+
+    async def invoke(self, prompt: str, purpose: str = "llm"):
+        """Response for prompt, sharing an identical call already in flight"""
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.setdefault(loop, {})
+        key = hashlib.sha256(prompt.encode()).digest()
+        task = inflight.get(key)
+        if task is None:
+            task = inflight[key] = loop.create_task(self._call(prompt, purpose))
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        else:
+            record_llm_call(purpose, 0.0, "coalesced")
+        # A cancelled caller must not cancel the call the other callers are waiting on
+        return await asyncio.shield(task)
+
+    async def _call(self, prompt: str, purpose: str):
+        from langchain_core.messages import HumanMessage
+
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    response = await asyncio.wait_for(
+                        self.client_factory().ainvoke([HumanMessage(content=prompt)]), self.timeout)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    record_llm_call(purpose, time.perf_counter() - start, "error")
+                    raise
+                record_llm_call(purpose, 0.0, "retry")
+                # Full jitter keeps retrying callers from arriving together again
+                await asyncio.sleep(random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt)))
+                attempt += 1
+                continue
+            prompt_tokens, completion_tokens = token_usage(response)
+            record_llm_call(purpose, time.perf_counter() - start, "ok", prompt_tokens, completion_tokens)
+            return response
+
+    def inflight(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> int:
+        """Distinct prompts currently in flight on a loop (the running one by default)"""
+        return len(self._inflight.get(loop or asyncio.get_running_loop(), {}))
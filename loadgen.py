@@ -0,0 +1,384 @@
+"""
+Replayable API workloads and an async load generator.
+
+Workload files are JSONL, one request template per line:
+
+    {"method": "POST", "path": "/api/chat", "body": {"message": "How many employees?"}, "weight": 5}
+    {"method": "GET", "path": "/api/reports", "weight": 1}
+
+``convert`` turns a backlog-style JSONL file (``request_id``/``title``/``body``
+per line, like requests.jsonl) into chat traffic mixed with schedule and report
+calls; ``run`` drives an API at a fixed concurrency (closed loop) or request
+rate (open loop) and reports latency percentiles, error rates and throughput
+over time.
+
+    python loadgen.py convert requests.jsonl -o workload.jsonl
+    python loadgen.py run workload.jsonl --url http://localhost:9000 --concurrency 20 --duration 60
+    python loadgen.py run workload.jsonl --rate 50 --duration 60 --output load_report.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_MIX = {"chat": 0.8, "schedule": 0.1, "reports": 0.1}
+
+
+@dataclass
+class WorkloadEntry:
+    method: str
+    path: str
+    body: Optional[dict] = None
+    weight: float = 1.0
+    name: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return self.name or f"{self.method} {self.path}"
+
+
+def load_workload(path: str) -> List[WorkloadEntry]:
+    """Read a workload JSONL file"""
+    entries = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            data = json.loads(line)
+            if "path" not in data:
+                raise ValueError(f"{path}:{line_number}: workload entries need a 'path'")
+            entries.append(WorkloadEntry(
+                method=data.get("method", "POST" if data.get("body") is not None else "GET").upper(),
+                path=data["path"],
+                body=data.get("body"),
+                weight=float(data.get("weight", 1.0)),
+                name=data.get("name"),
+            ))
+    if not entries:
+        raise ValueError(f"{path}: empty workload")
+    return entries
+
+
+def convert_requests(path: str, mix: Dict[str, float] = None) -> List[dict]:
+    """Build a workload from backlog-style JSONL (request_id, title, body per line)"""
+    mix = mix or DEFAULT_MIX
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            request = json.loads(line)
+            message = request.get("title") or request.get("body", "")[:200]
+            entries.append({
+                "name": "chat",
+                "method": "POST",
+                "path": "/api/chat",
+                "body": {"message": message, "session_id": request.get("request_id", "loadgen")},
+                "weight": 1.0,
+            })
+
+    chat_weight = len(entries) or 1
+    if mix.get("schedule"):
+        entries.append({
+            "name": "schedule",
+            "method": "POST",
+            "path": "/api/schedule",
+            "body": {"report_name": "Load test report", "sql_query": "SELECT COUNT(*) FROM employees",
+                     "schedule_type": "daily", "schedule_time": "09:00"},
+            "weight": chat_weight * mix["schedule"] / mix.get("chat", 1.0),
+        })
+    if mix.get("reports"):
+        entries.append({
+            "name": "reports",
+            "method": "GET",
+            "path": "/api/reports",
+            "weight": chat_weight * mix["reports"] / mix.get("chat", 1.0),
+        })
+    return entries
+
+
+class HttpConnection:
+    """Minimal keep-alive HTTP/1.1 client connection on asyncio streams"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: Optional[bytes]) -> int:
+        """Send a request and read the full response; returns the status code"""
+        if self.writer is None:
+            await self._connect()
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                   "Accept-Encoding: identity", "Connection: keep-alive"]
+        if body is not None:
+            headers += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        self.writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + (body or b""))
+        try:
+            return await asyncio.wait_for(self._read_response(), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _read_response(self) -> int:
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+
+        length = None
+        chunked = False
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value:
+                chunked = True
+            elif name == "connection" and value == "close":
+                keep_alive = False
+
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length is not None:
+            await self.reader.readexactly(length)
+        else:
+            await self.reader.read()
+            keep_alive = False
+
+        if not keep_alive:
+            self.close()
+        return status
+
+
+@dataclass
+class Sample:
+    start: float
+    latency: float
+    label: str
+    ok: bool
+    error: Optional[str] = None
+
+
+@dataclass
+class LoadRun:
+    url: str
+    entries: List[WorkloadEntry]
+    concurrency: int
+    rate: Optional[float]
+    duration: float
+    timeout: float
+    seed: int
+    samples: List[Sample] = field(default_factory=list)
+
+    async def run(self):
+        parts = urlsplit(self.url)
+        host, port = parts.hostname, parts.port or 80
+        self.base_path = parts.path.rstrip("/")
+        self.rng = random.Random(self.seed)
+        self.weights = [e.weight for e in self.entries]
+        self.bodies = {id(e): json.dumps(e.body).encode() if e.body is not None else None for e in self.entries}
+
+        self.connections = asyncio.Queue()
+        for _ in range(self.concurrency):
+            self.connections.put_nowait(HttpConnection(host, port, self.timeout))
+
+        self.started = time.perf_counter()
+        self.deadline = self.started + self.duration
+        if self.rate:
+            await self._open_loop()
+        else:
+            await asyncio.gather(*(self._closed_loop_worker() for _ in range(self.concurrency)))
+
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+    def _pick(self) -> WorkloadEntry:
+        return self.rng.choices(self.entries, weights=self.weights)[0]
+
+    async def _send(self, entry: WorkloadEntry, scheduled: float):
+        connection = await self.connections.get()
+        try:
+            status = await connection.request(entry.method, self.base_path + entry.path, self.bodies[id(entry)])
+            ok, error = 200 <= status < 400, None if 200 <= status < 400 else f"HTTP {status}"
+        except Exception as e:
+            ok, error = False, type(e).__name__
+        finally:
+            self.connections.put_nowait(connection)
+        # Open-loop latency is measured from the scheduled send time so queueing shows up
+        self.samples.append(Sample(scheduled - self.started, time.perf_counter() - scheduled, entry.label, ok, error))
+
+    async def _closed_loop_worker(self):
+        while time.perf_counter() < self.deadline:
+            await self._send(self._pick(), time.perf_counter())
+
+    async def _open_loop(self):
+        interval = 1.0 / self.rate
+        tasks = set()
+        next_send = time.perf_counter()
+        while next_send < self.deadline:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(self._send(self._pick(), next_send))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_send += interval
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> dict:
+    """Latency percentiles (ms), error rate and throughput for a set of samples"""
+    latencies = sorted(s.latency * 1000 for s in samples)
+    errors = [s for s in samples if not s.ok]
+    error_kinds = defaultdict(int)
+    for s in errors:
+        error_kinds[s.error] += 1
+    return {
+        "requests": len(samples),
+        "errors": len(errors),
+        "error_rate": len(errors) / len(samples) if samples else 0.0,
+        "error_kinds": dict(error_kinds),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else None,
+    }
+
+
+def build_report(load_run: LoadRun, interval: float) -> dict:
+    samples = load_run.samples
+    elapsed = max((s.start + s.latency for s in samples), default=load_run.duration)
+
+    by_label = defaultdict(list)
+    buckets = defaultdict(list)
+    for s in samples:
+        by_label[s.label].append(s)
+        buckets[int(s.start // interval)].append(s)
+
+    return {
+        "config": {
+            "url": load_run.url,
+            "mode": "open" if load_run.rate else "closed",
+            "concurrency": load_run.concurrency,
+            "rate": load_run.rate,
+            "duration": load_run.duration,
+            "seed": load_run.seed,
+        },
+        "overall": summarize(samples, elapsed),
+        "endpoints": {label: summarize(group, elapsed) for label, group in sorted(by_label.items())},
+        "timeline": [
+            {"t": bucket * interval, **summarize(group, interval)}
+            for bucket, group in sorted(buckets.items())
+        ],
+    }
+
+
+def print_report(report: dict):
+    def row(name, stats):
+        p50 = stats["p50_ms"] or 0.0
+        p95 = stats["p95_ms"] or 0.0
+        p99 = stats["p99_ms"] or 0.0
+        print(f"{name:28} {stats['requests']:>8} {stats['throughput_rps']:>9.1f} {stats['error_rate']:>7.2%} "
+              f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+
+    header = f"{'':28} {'requests':>8} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    row("overall", report["overall"])
+    for label, stats in report["endpoints"].items():
+        row(label, stats)
+    print("\ntimeline:")
+    print(f"{'t (s)':>28} {'requests':>8} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for point in report["timeline"]:
+        row(f"{point['t']:.0f}", point)
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay API workloads")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="build a workload from backlog-style JSONL")
+    convert.add_argument("source")
+    convert.add_argument("-o", "--output", default="-")
+    convert.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                         help="traffic mix, e.g. chat=0.8,schedule=0.1,reports=0.1")
+
+    run = commands.add_parser("run", help="drive the API with a workload")
+    run.add_argument("workload")
+    run.add_argument("--url", default="http://localhost:9000")
+    run.add_argument("--concurrency", type=int, default=10, help="workers (closed loop) or max connections")
+    run.add_argument("--rate", type=float, help="requests per second (open loop)")
+    run.add_argument("--duration", type=float, default=30.0)
+    run.add_argument("--timeout", type=float, default=30.0)
+    run.add_argument("--interval", type=float, default=5.0, help="timeline bucket size in seconds")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--output", help="write the JSON report here")
+
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        lines = "".join(json.dumps(e) + "\n" for e in convert_requests(args.source, args.mix))
+        if args.output == "-":
+            sys.stdout.write(lines)
+        else:
+            with open(args.output, "w") as f:
+                f.write(lines)
+        return
+
+    load_run = LoadRun(url=args.url, entries=load_workload(args.workload), concurrency=args.concurrency,
+                       rate=args.rate, duration=args.duration, timeout=args.timeout, seed=args.seed)
+    asyncio.run(load_run.run())
+    report = build_report(load_run, args.interval)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
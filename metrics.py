@@ -0,0 +1,272 @@
+"""
+Latency instrumentation for the chat pipeline, scheduler and feedback store.
+
+- ``span(stage)`` times a pipeline stage into a histogram and the current trace
+- ``request_trace(name)`` groups the spans of one request and logs a breakdown
+- ``record_query(db, sql, seconds)`` per-database timings plus a slow-query log
+- ``record_llm_call(purpose, seconds, ...)`` LLM latency, outcomes and token usage
+- ``render_prometheus()`` text exposition for a ``/metrics`` endpoint
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Sequence, Tuple
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "1.0"))
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("sql_assistant.metrics")
+slow_query_logger = logging.getLogger("sql_assistant.slow_query")
+
+_current_trace = contextvars.ContextVar("sql_assistant_trace", default=None)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "sql_assistant_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "sql_assistant_stage_errors_total", "Pipeline stages that raised an exception", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "sql_assistant_request_seconds", "End-to-end request latency", ["request"])
+QUERY_SECONDS = REGISTRY.histogram(
+    "sql_assistant_query_seconds", "SQL execution time per database", ["db"])
+SLOW_QUERIES = REGISTRY.counter(
+    "sql_assistant_slow_queries_total", "Queries slower than SLOW_QUERY_SECONDS", ["db"])
+LLM_SECONDS = REGISTRY.histogram(
+    "sql_assistant_llm_seconds", "LLM call latency, queueing and retries included", ["purpose"])
+LLM_CALLS = REGISTRY.counter(
+    "sql_assistant_llm_calls_total", "LLM calls by outcome (ok, error, retry, coalesced)", ["purpose", "outcome"])
+LLM_TOKENS = REGISTRY.counter(
+    "sql_assistant_llm_tokens_total", "LLM tokens used", ["purpose", "kind"])
+
+
+def render_prometheus() -> str:
+    """Prometheus text exposition of all metrics"""
+    return REGISTRY.render()
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((stage, elapsed))
+
+
+def timed(stage: str):
+    """Decorator form of span() for sync and async functions"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def request_trace(name: str):
+    """Collect the spans of one request and log a per-stage breakdown"""
+    trace = []
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_trace.reset(token)
+        REQUEST_SECONDS.observe(elapsed, request=name)
+        if logger.isEnabledFor(logging.DEBUG):
+            breakdown = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in trace)
+            logger.debug("trace %s total=%.1fms %s", name, elapsed * 1000, breakdown)
+
+
+def record_query(db_name: str, sql: str, seconds: float):
+    """Record a query timing; log the SQL text of slow queries"""
+    QUERY_SECONDS.observe(seconds, db=db_name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((f"sql:{db_name}", seconds))
+    if seconds >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.inc(db=db_name)
+        slow_query_logger.warning("slow query on %s (%.3fs): %s", db_name, seconds, " ".join(sql.split()))
+
+
+def record_llm_call(purpose: str, seconds: float, outcome: str = "ok",
+                    prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Record one LLM call; "retry" and "coalesced" outcomes only count"""
+    LLM_CALLS.inc(purpose=purpose, outcome=outcome)
+    if outcome in ("retry", "coalesced"):
+        return
+    LLM_SECONDS.observe(seconds, purpose=purpose)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, purpose=purpose, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, purpose=purpose, kind="completion")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((f"llm:{purpose}", seconds))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /metrics from a background thread (for processes without an HTTP app)"""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def start_metrics_server_from_env() -> Optional[ThreadingHTTPServer]:
+    """Start the metrics server if METRICS_PORT is set"""
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return start_metrics_server(int(port))
+    except Exception as e:
+        print(f"Error starting metrics server on port {port}: {e}")
+        return None
@@ -0,0 +1,210 @@
+"""
+Pre-execution guard for generated SQL.
+
+Runs EXPLAIN (cached per normalized query) and compares the planner's
+estimated cost and row count against per-database budgets. A query is
+either allowed as is, limited (LIMIT injected), rewritten to a sampled
+form, or rejected before it can load the database.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+DEFAULT_BUDGET = {
+    "max_rows": 1000,          # inject a LIMIT above this many estimated rows
+    "max_cost": 50000.0,       # try a sampled rewrite above this cost
+    "reject_cost": 1000000.0,  # refuse outright above this cost
+}
+
+# Overrides of DEFAULT_BUDGET per admission priority class. Scheduled reports are expected to
+# be large: they get a high row cap, and sampling is off (max_cost == reject_cost) so a report
+# is either complete or rejected, never silently sampled.
+PRIORITY_BUDGETS = {
+    "scheduled": {"max_rows": 1000000, "max_cost": 100000000.0, "reject_cost": 100000000.0},
+}
+
+# Per-database overrides of DEFAULT_BUDGET
+DB_BUDGETS = {
+    "db1": {},
+    "db2": {},
+    "db3": {},
+}
+
+PLAN_CACHE_SIZE = 512
+PLAN_CACHE_TTL = 600  # seconds
+
+_READ_ONLY_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+_FORBIDDEN_RE = re.compile(
+    r"\b(insert|update|delete|drop|alter|truncate|create|grant|revoke|copy|vacuum|call)\b", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"\blimit\s+(\d+)\b", re.IGNORECASE)
+_TRAILING_LIMIT_RE = re.compile(r"\blimit\s+(\d+)(\s+offset\s+\d+)?\s*$", re.IGNORECASE)
+_AGGREGATE_RE = re.compile(r"\b(count|sum|avg|min|max)\s*\(|\bgroup\s+by\b", re.IGNORECASE)
+_SIMPLE_FROM_RE = re.compile(r"\bfrom\s+([a-z_][\w.]*)(\s+(?:as\s+)?[a-z_]\w*)?\s*(?=where\b|order\b|limit\b|$)",
+                             re.IGNORECASE)
+_JOIN_RE = re.compile(r"\bjoin\b|,\s*[a-z_]", re.IGNORECASE)
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_QUOTED_OR_COMMENT_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class GuardDecision:
+    """Outcome of checking one query"""
+    action: str  # "allow", "limit", "sample" or "reject"
+    sql: str
+    reason: str = ""
+    estimated_cost: Optional[float] = None
+    estimated_rows: Optional[int] = None
+
+    @property
+    def allowed(self) -> bool:
+        return self.action != "reject"
+
+
+def normalize_query(sql: str) -> str:
+    """Normalize SQL for plan caching (case, whitespace, trailing semicolon)"""
+    return _WHITESPACE_RE.sub(" ", sql.strip().rstrip(";").strip()).lower()
+
+
+def is_single_statement(sql: str) -> bool:
+    """No semicolon outside quotes except one at the end"""
+    body = _QUOTED_RE.sub("''", sql).strip()
+    if body.endswith(";"):
+        body = body[:-1]
+    return ";" not in body
+
+
+def strip_comments(sql: str) -> str:
+    """SQL with -- and /* */ comments outside quotes replaced by spaces"""
+    return _QUOTED_OR_COMMENT_RE.sub(lambda m: m.group(0) if m.group(0)[0] in "'\"" else " ", sql)
+
+
+def _statement_body(sql: str) -> str:
+    """Comment-free SQL without the trailing semicolon, ready to be extended"""
+    return strip_comments(sql).strip().rstrip(";").rstrip()
+
+
+def _mask_quoted(sql: str) -> str:
+    """SQL with quoted text blanked out, keeping every offset"""
+    return _QUOTED_RE.sub(lambda m: m.group(0)[0] + " " * (len(m.group(0)) - 2) + m.group(0)[-1], sql)
+
+
+def _top_level_limit(body: str):
+    """Match for the query's own trailing LIMIT (not a subquery's or one in a string), or None"""
+    masked = _mask_quoted(body)
+    match = _TRAILING_LIMIT_RE.search(masked)
+    if match and masked.count("(", 0, match.start()) == masked.count(")", 0, match.start()):
+        return match
+    return None
+
+
+def inject_limit(sql: str, limit: int) -> str:
+    """Cap a query at limit rows
+
+    A trailing top-level LIMIT is lowered; a query with no LIMIT gets one on
+    its own line (so it can't end up in a comment); a query whose only LIMITs
+    are nested is wrapped in SELECT * FROM (...) q LIMIT n.
+    """
+    body = _statement_body(sql)
+    match = _top_level_limit(body)
+    if match:
+        if int(match.group(1)) <= limit:
+            return body
+        return body[:match.start(1)] + str(limit) + body[match.end(1):]
+    if _LIMIT_RE.search(_mask_quoted(body)):
+        return f"SELECT * FROM (\n{body}\n) q LIMIT {limit}"
+    return f"{body}\nLIMIT {limit}"
+
+
+def sample_query(sql: str, percent: float) -> Optional[str]:
+    """Rewrite a single-table query to read a TABLESAMPLE of the table.
+
+    Returns None if the query isn't a simple single-table SELECT.
+    """
+    body = _statement_body(sql)
+    match = _SIMPLE_FROM_RE.search(body)
+    if not match or _JOIN_RE.search(body, match.start()):
+        return None
+    table, alias = match.group(1), match.group(2) or ""
+    sampled = f"FROM {table}{alias} TABLESAMPLE SYSTEM ({percent:.4g}) "
+    return body[:match.start()] + sampled + body[match.end():]
+
+
+class QueryGuard:
+    """EXPLAIN-based budget check for user-generated SQL"""
+
+    def __init__(self, budgets: Optional[Dict[str, Dict]] = None):
+        self.budgets = budgets if budgets is not None else DB_BUDGETS
+        self._plans = OrderedDict()  # (db_name, normalized query) -> (timestamp, cost, rows)
+        self._lock = threading.Lock()
+
+    def budget_for(self, db_name: str, priority: Optional[str] = None) -> Dict:
+        return {**DEFAULT_BUDGET, **self.budgets.get(db_name, {}), **PRIORITY_BUDGETS.get(priority, {})}
+
+    def explain(self, cursor, sql: str, db_name: str):
+        """Estimated (total cost, plan rows) for a query, cached per normalized query"""
+        # Literals stay in the key: LIMIT values and predicates change the row estimate
+        key = (db_name, normalize_query(sql))
+        with self._lock:
+            cached = self._plans.get(key)
+            if cached and time.monotonic() - cached[0] < PLAN_CACHE_TTL:
+                self._plans.move_to_end(key)
+                return cached[1], cached[2]
+
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}")
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        top = plan[0]["Plan"]
+        cost, rows = float(top["Total Cost"]), int(top["Plan Rows"])
+
+        with self._lock:
+            self._plans[key] = (time.monotonic(), cost, rows)
+            self._plans.move_to_end(key)
+            while len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return cost, rows
+
+    def check(self, cursor, sql: str, db_name: str, priority: Optional[str] = None) -> GuardDecision:
+        """Decide whether and how a query may run (under the priority class's budget)"""
+        if not _READ_ONLY_RE.match(sql) or _FORBIDDEN_RE.search(_STRING_LITERAL_RE.sub("''", sql)):
+            return GuardDecision("reject", sql, "only read-only SELECT queries are allowed")
+        if not is_single_statement(sql):
+            # EXPLAIN would run every statement after the first
+            return GuardDecision("reject", sql, "only a single SQL statement is allowed")
+
+        try:
+            cost, rows = self.explain(cursor, sql, db_name)
+        except Exception as e:
+            return GuardDecision("reject", sql, f"query could not be planned: {e}")
+
+        budget = self.budget_for(db_name, priority)
+        if cost > budget["reject_cost"]:
+            return GuardDecision("reject", sql, f"estimated cost {cost:.0f} exceeds budget", cost, rows)
+
+        if cost > budget["max_cost"]:
+            if _AGGREGATE_RE.search(sql):
+                # Aggregates over a sample would be silently wrong
+                return GuardDecision("reject", sql, f"estimated cost {cost:.0f} is too high to aggregate",
+                                     cost, rows)
+            percent = max(0.01, 100.0 * budget["max_cost"] / cost)
+            sampled = sample_query(sql, percent)
+            if sampled is None:
+                return GuardDecision("reject", sql, f"estimated cost {cost:.0f} exceeds budget", cost, rows)
+            sampled = inject_limit(sampled, budget["max_rows"])
+            return GuardDecision("sample", sampled, f"sampled {percent:.2g}% of rows (cost {cost:.0f})",
+                                 cost, rows)
+
+        limit_match = _top_level_limit(_statement_body(sql))
+        if rows > budget["max_rows"] and (not limit_match or int(limit_match.group(1)) > budget["max_rows"]):
+            limited = inject_limit(sql, budget["max_rows"])
+            return GuardDecision("limit", limited, f"limited to {budget['max_rows']} rows (estimated {rows})",
+                                 cost, rows)
+
+        return GuardDecision("allow", sql, "", cost, rows)
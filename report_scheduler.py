@@ -1,72 +1,164 @@
-import sqlite3
+import csv
+import io
+import os
+import threading
 from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
 import json
+from admission import admission_context
+from metrics import request_trace, span
+from sqlite_store import SQLiteStore
+
+# Every worker process loads the saved reports into its own APScheduler (load_jobs), and the
+# triggers fire at the same times everywhere; a run claimed within this window is not started
+# again by another process
+REPORT_CLAIM_SECONDS = int(os.getenv("REPORT_CLAIM_SECONDS", "60"))
+
+SCHEDULE_TYPES = ("daily", "weekly", "hourly")
+# Columns of an exported report definition (also what schedule_reports accepts)
+REPORT_EXPORT_COLUMNS = ["id", "report_name", "sql_query", "database_name", "schedule_type", "schedule_time",
+                         "last_run", "next_run", "created_at"]
+
+def parse_report_csv(text: str):
+    """Report definitions from CSV text with a header row (quoted fields may span lines)"""
+    return list(csv.DictReader(io.StringIO(text, newline="")))
 
 class ReportScheduler:
-    def __init__(self, db_path="scheduled_reports.db"):
+    def __init__(self, db_path="scheduled_reports.db", query_executor=None,
+                 claim_seconds=REPORT_CLAIM_SECONDS):
         self.db_path = db_path
-        self.scheduler = BackgroundScheduler()
+        # Callable (sql_query, db_name, guard_decisions=list) -> (rows, columns) or (None, error)
+        self.query_executor = query_executor
+        self.claim_seconds = claim_seconds
+        self.store = SQLiteStore(db_path)
+        self._scheduler = None
+        self._scheduler_lock = threading.Lock()
         self.init_database()
-        self.scheduler.start()
+    
+    @property
+    def scheduler(self):
+        """APScheduler instance, imported and started when the first job is added"""
+        if self._scheduler is None:
+            with self._scheduler_lock:
+                if self._scheduler is None:
+                    from apscheduler.schedulers.background import BackgroundScheduler
+                    scheduler = BackgroundScheduler()
+                    scheduler.start()
+                    self._scheduler = scheduler
+        return self._scheduler
     
     def init_database(self):
         """Initialize scheduler database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scheduled_reports (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                report_name TEXT,
-                sql_query TEXT,
-                database_name TEXT,
-                schedule_type TEXT,
-                schedule_time TEXT,
-                last_run DATETIME,
-                next_run DATETIME,
-                is_active BOOLEAN DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS report_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                report_id INTEGER,
-                result_data TEXT,
-                run_time DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (report_id) REFERENCES scheduled_reports (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self.store.write() as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scheduled_reports (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    report_name TEXT,
+                    sql_query TEXT,
+                    database_name TEXT,
+                    schedule_type TEXT,
+                    schedule_time TEXT,
+                    last_run DATETIME,
+                    next_run DATETIME,
+                    is_active BOOLEAN DEFAULT 1,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS report_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    report_id INTEGER,
+                    result_data TEXT,
+                    run_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (report_id) REFERENCES scheduled_reports (id)
+                )
+            ''')
     
     def schedule_report(self, report_name: str, sql_query: str, db_name: str, 
                        schedule_type: str, schedule_time: str):
         """Schedule a new report"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Calculate next run time
         next_run = self._calculate_next_run(schedule_type, schedule_time)
         
-        cursor.execute('''
-            INSERT INTO scheduled_reports 
-            (report_name, sql_query, database_name, schedule_type, schedule_time, next_run)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (report_name, sql_query, db_name, schedule_type, schedule_time, next_run))
-        
-        report_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.store.write() as cursor:
+            cursor.execute('''
+                INSERT INTO scheduled_reports 
+                (report_name, sql_query, database_name, schedule_type, schedule_time, next_run)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (report_name, sql_query, db_name, schedule_type, schedule_time, next_run))
+            report_id = cursor.lastrowid
         
         # Add to scheduler
-        self._add_to_scheduler(report_id, schedule_type, schedule_time)
+        self._add_to_scheduler(report_id, schedule_type, schedule_time, next_run)
         
         return report_id
     
+    def schedule_reports(self, definitions, default_db: str = "db1"):
+        """Schedule many reports in one transaction
+        
+        definitions: dicts with report_name, sql_query, schedule_type, schedule_time
+        and optionally database_name. Returns (report_ids, None), or (None, errors)
+        with nothing scheduled if any definition is invalid.
+        """
+        from database import DB_CONFIGS
+        
+        rows, errors = [], []
+        # Next runs and triggers depend only on the schedule, so each distinct one is computed once
+        next_runs = {}
+        for index, definition in enumerate(definitions):
+            if not isinstance(definition, dict):
+                errors.append(f"Report {index}: expected an object, got {type(definition).__name__}")
+                continue
+            fields = {field: definition.get(field) for field in
+                      ("report_name", "sql_query", "schedule_type", "schedule_time", "database_name")}
+            wrong_type = [field for field, value in fields.items()
+                          if value is not None and not isinstance(value, str)]
+            if wrong_type:
+                errors.append(f"Report {index}: {', '.join(wrong_type)} must be text")
+                continue
+            name = (fields["report_name"] or "").strip()
+            query = (fields["sql_query"] or "").strip()
+            db_name = (fields["database_name"] or "").strip() or default_db
+            schedule = (fields["schedule_type"] or "", (fields["schedule_time"] or "").strip())
+            if not name or not query:
+                errors.append(f"Report {index}: report_name and sql_query are required")
+                continue
+            if db_name not in DB_CONFIGS:
+                errors.append(f"Report {index}: unknown database_name {db_name!r}")
+                continue
+            if schedule[0] not in SCHEDULE_TYPES:
+                errors.append(f"Report {index}: schedule_type must be one of {', '.join(SCHEDULE_TYPES)}")
+                continue
+            if schedule not in next_runs:
+                try:
+                    next_runs[schedule] = self._calculate_next_run(*schedule)
+                except (ValueError, IndexError):
+                    next_runs[schedule] = None
+            if next_runs[schedule] is None:
+                errors.append(f"Report {index}: invalid {schedule[0]} schedule_time {schedule[1]!r}")
+                continue
+            rows.append((name, query, db_name, schedule[0], schedule[1], next_runs[schedule]))
+        if errors:
+            return None, errors
+        if not rows:
+            return [], None
+        
+        # One transaction for the whole batch; each row's id is read back as it is inserted
+        report_ids = []
+        with self.store.write() as cursor:
+            for row in rows:
+                cursor.execute('''
+                    INSERT INTO scheduled_reports 
+                    (report_name, sql_query, database_name, schedule_type, schedule_time, next_run)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', row)
+                report_ids.append(cursor.lastrowid)
+        
+        self._add_jobs_to_scheduler([(report_id, row[3], row[4], row[5])
+                                     for report_id, row in zip(report_ids, rows)])
+        
+        return report_ids, None
+    
     def _calculate_next_run(self, schedule_type: str, schedule_time: str):
         """Calculate next run time"""
         now = datetime.now()
@@ -92,63 +184,148 @@ class ReportScheduler:
             
         return next_run
     
-    def _add_to_scheduler(self, report_id: int, schedule_type: str, schedule_time: str):
-        """Add job to APScheduler"""
+    def _job_trigger(self, schedule_type: str, schedule_time: str, next_run=None):
+        """APScheduler trigger for a schedule, or None if it isn't run by APScheduler"""
         if schedule_type == "daily":
+            from apscheduler.triggers.cron import CronTrigger
             hour, minute = map(int, schedule_time.split(':'))
-            self.scheduler.add_job(
-                self._run_report, 'cron', 
-                hour=hour, minute=minute,
-                args=[report_id], id=f"report_{report_id}"
-            )
+            return CronTrigger(hour=hour, minute=minute)
         elif schedule_type == "hourly":
-            self.scheduler.add_job(
-                self._run_report, 'interval', 
-                hours=1, args=[report_id], id=f"report_{report_id}"
-            )
+            from apscheduler.triggers.interval import IntervalTrigger
+            # Anchored at the stored first run so every process fires on the same hourly grid
+            if isinstance(next_run, str):
+                next_run = datetime.fromisoformat(next_run)
+            return IntervalTrigger(hours=1, start_date=next_run)
+        return None
+    
+    def _add_to_scheduler(self, report_id: int, schedule_type: str, schedule_time: str, next_run=None):
+        """Add job to APScheduler"""
+        self._add_jobs_to_scheduler([(report_id, schedule_type, schedule_time, next_run)])
+    
+    def _add_jobs_to_scheduler(self, jobs):
+        """Add (report_id, schedule_type, schedule_time, next_run) jobs, one trigger per distinct schedule"""
+        triggers = {}
+        for report_id, schedule_type, schedule_time, next_run in jobs:
+            schedule = (schedule_type, schedule_time, next_run if schedule_type == "hourly" else None)
+            if schedule not in triggers:
+                triggers[schedule] = self._job_trigger(schedule_type, schedule_time, next_run)
+            if triggers[schedule] is not None:
+                self.scheduler.add_job(self._run_report, triggers[schedule], args=[report_id],
+                                       id=f"report_{report_id}", replace_existing=True)
+    
+    def load_jobs(self):
+        """Register every active report with this process's scheduler; returns how many were read"""
+        with self.store.read() as cursor:
+            cursor.execute('''
+                SELECT id, schedule_type, schedule_time, next_run FROM scheduled_reports
+                WHERE is_active = 1
+            ''')
+            jobs = cursor.fetchall()
+        self._add_jobs_to_scheduler(jobs)
+        return len(jobs)
     
     def _run_report(self, report_id: int):
         """Execute scheduled report"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get report details
-        cursor.execute('SELECT * FROM scheduled_reports WHERE id = ?', (report_id,))
-        report = cursor.fetchone()
+        # Scheduled class: not starved by chat bursts, queued per report
+        with request_trace("report"), admission_context("scheduled", f"report_{report_id}"):
+            self._execute_report(report_id)
+    
+    def _execute_report(self, report_id: int):
+        """Run a report's query and store the result"""
+        # Claim the run: with several worker processes each scheduler fires the job,
+        # and only the one whose UPDATE lands runs it
+        with self.store.write() as cursor:
+            cursor.execute('''
+                UPDATE scheduled_reports 
+                SET last_run = CURRENT_TIMESTAMP 
+                WHERE id = ? AND (last_run IS NULL OR last_run <= datetime('now', ?))
+            ''', (report_id, f"-{self.claim_seconds} seconds"))
+            claimed = cursor.rowcount == 1
+            cursor.execute('SELECT * FROM scheduled_reports WHERE id = ?', (report_id,))
+            report = cursor.fetchone()
         
-        if not report:
+        if not report or not claimed:
             return
         
-        # Execute query (simplified - would use your existing DB functions)
-        result_data = f"Report executed at {datetime.now()}"
+        # Execute query through the shared DB layer (pooled, prepared statements)
+        sql_query, db_name = report[2], report[3]
+        # Runs under the scheduled budget; a limit or sample by the query guard is stored with the result
+        guard_decisions = []
+        with span("report_query"):
+            results, columns_or_error = self._get_query_executor()(sql_query, db_name,
+                                                                   guard_decisions=guard_decisions)
+        if results is None:
+            result_data = json.dumps({"error": columns_or_error, "run_time": datetime.now().isoformat()})
+        else:
+            # Stored column-oriented: {"columns": [...], "data": [[column values], ...]}
+            from result_table import as_table
+            data = as_table(results, columns_or_error).to_dict()
+            if guard_decisions:
+                data["partial"] = f"{guard_decisions[-1].action}: {guard_decisions[-1].reason}"
+            result_data = json.dumps(data, default=str)
         
         # Save result
-        cursor.execute('''
-            INSERT INTO report_results (report_id, result_data)
-            VALUES (?, ?)
-        ''', (report_id, result_data))
-        
-        # Update last run
-        cursor.execute('''
-            UPDATE scheduled_reports 
-            SET last_run = CURRENT_TIMESTAMP 
-            WHERE id = ?
-        ''', (report_id,))
-        
-        conn.commit()
-        conn.close()
+        with self.store.write() as cursor:
+            cursor.execute('''
+                INSERT INTO report_results (report_id, result_data)
+                VALUES (?, ?)
+            ''', (report_id, result_data))
+    
+    def _get_query_executor(self):
+        """Query executor, defaulting to the shared database layer"""
+        if self.query_executor is None:
+            from database import execute_sql_query
+            self.query_executor = execute_sql_query
+        return self.query_executor
     
     def get_scheduled_reports(self):
         """Get all scheduled reports"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM scheduled_reports WHERE is_active = 1')
-        reports = cursor.fetchall()
-        conn.close()
+        with self.store.read() as cursor:
+            cursor.execute('SELECT * FROM scheduled_reports WHERE is_active = 1')
+            reports = cursor.fetchall()
         
         return reports
     
+    def iter_report_definitions(self, batch_size: int = 1000):
+        """Active report definitions (REPORT_EXPORT_COLUMNS) in batches of rows, read with one cursor"""
+        with self.store.read() as cursor:
+            cursor.execute(f'''
+                SELECT {", ".join(REPORT_EXPORT_COLUMNS)} FROM scheduled_reports
+                WHERE is_active = 1 ORDER BY id
+            ''')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+    
+    def get_latest_result(self, report_id: int):
+        """Most recent stored result as (ResultTable, info) or (None, error)
+        
+        info has the run_time, and partial (the query guard's limit/sample, else None).
+        """
+        with self.store.read() as cursor:
+            cursor.execute('''
+                SELECT result_data, run_time FROM report_results
+                WHERE report_id = ? ORDER BY id DESC LIMIT 1
+            ''', (report_id,))
+            row = cursor.fetchone()
+        
+        if row is None:
+            return None, f"No results for report {report_id}"
+        data = json.loads(row[0])
+        if "error" in data:
+            return None, data["error"]
+        
+        from result_table import ResultTable
+        info = {"run_time": row[1], "partial": data.get("partial")}
+        if "rows" in data:
+            # Row-oriented results stored before the column-oriented format
+            return ResultTable.from_rows(data["rows"], data["columns"]), info
+        return ResultTable.from_dict(data), info
+    
     def stop_scheduler(self):
         """Stop the scheduler"""
-        self.scheduler.shutdown()
\ No newline at end of file
+        if self._scheduler is not None:
+            self._scheduler.shutdown()
+            self._scheduler = None
\ No newline at end of file
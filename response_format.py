@@ -0,0 +1,245 @@
+"""
+Response formatting for the chat and API paths.
+
+Text tables for chat are written in one pass (one join over the rows
+instead of growing a string row by row). API results are encoded as JSON,
+CSV or Arrow IPC in chunks of ``RESPONSE_CHUNK_ROWS`` so large results
+stream out without building the whole payload first, and the byte stream
+is gzip- or brotli-compressed per the client's Accept-Encoding.
+Row batches read lazily from a cursor (e.g. the report catalogue export)
+stream the same way as JSON records or CSV.
+
+Arrow output needs pyarrow and brotli needs the brotli package; both are
+imported only when used, and negotiation skips them if they're missing.
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+RESPONSE_CHUNK_ROWS = int(os.getenv("RESPONSE_CHUNK_ROWS", "5000"))
+RESPONSE_MAX_ROWS = int(os.getenv("RESPONSE_MAX_ROWS", "1000000"))
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # 11 is far slower for little gain on tables
+TEXT_MAX_ROWS = 20
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "text": "text/plain; charset=utf-8",
+}
+_FORMAT_BY_MIME = {content_type.split(";")[0]: fmt for fmt, content_type in CONTENT_TYPES.items()}
+
+
+def text_table(results, columns, max_rows: int = TEXT_MAX_ROWS, separator: str = "  |  ") -> str:
+    """Header, rule and up to max_rows rows as one string, written in a single pass"""
+    from result_table import as_table
+
+    table = as_table(results, columns)
+    header = separator.join(table.columns)
+    # The rule spans the header plus the newline on either side, as it always has
+    lines = ["", header, "-" * (len(header) + 2)]
+    lines.extend(separator.join(map(str, row)) for row in table[:max_rows])
+    if len(table) > max_rows:
+        lines.append(f"\n... and {len(table) - max_rows} more rows")
+    else:
+        lines.append("")
+    return "\n".join(lines)
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str] = None) -> Optional[str]:
+    """Output format from a ?format= value, else the Accept header; JSON by default, None if unsupported"""
+    if requested:
+        fmt = requested.lower()
+        return fmt if fmt in CONTENT_TYPES else None
+    for mime, _ in _parse_quality_list(accept):
+        if mime in _FORMAT_BY_MIME:
+            return _FORMAT_BY_MIME[mime]
+    return "json"
+
+
+def _parse_quality_list(header: Optional[str]):
+    """(value, q) pairs from an Accept-style header, highest q first, q=0 dropped"""
+    entries = []
+    for position, part in enumerate((header or "").split(",")):
+        value, *params = [piece.strip() for piece in part.split(";")]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            entries.append((-quality, position, value.lower()))
+    return [(value, -quality) for quality, _, value in sorted(entries)]
+
+
+def _brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """"br" or "gzip" when the client accepts it (brotli preferred on a tie), else None"""
+    accepted = dict(_parse_quality_list(accept_encoding))
+    wildcard = accepted.get("*")
+    candidates = []
+    for encoding, preference in (("br", 1), ("gzip", 0)):
+        quality = accepted.get(encoding, wildcard)
+        if quality and (encoding != "br" or _brotli_available()):
+            candidates.append((quality, preference, encoding))
+    return max(candidates)[2] if candidates else None
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Compress a byte stream incrementally (pass-through when encoding is None)"""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "br":
+        import brotli
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        # wbits=31 writes the gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def compress_payload(data: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress a whole payload if it is large enough and the client accepts it"""
+    encoding = negotiate_encoding(accept_encoding) if len(data) >= COMPRESS_MIN_BYTES else None
+    if encoding is None:
+        return data, None
+    return b"".join(compress_chunks([data], encoding)), encoding
+
+
+def _row_chunks(table, chunk_rows: int):
+    for start in range(0, len(table), chunk_rows):
+        yield table[start:start + chunk_rows]
+
+
+def iter_json(table, chunk_rows: int = RESPONSE_CHUNK_ROWS) -> Iterator[str]:
+    """{"columns": [...], "rows": [[...], ...]} written a chunk of rows at a time"""
+    yield f'{{"columns": {json.dumps(table.columns)}, "rows": ['
+    separator = ""
+    for chunk in _row_chunks(table, chunk_rows):
+        # Dump the chunk as one list and strip its brackets
+        yield separator + json.dumps(chunk.rows(), default=str)[1:-1]
+        separator = ", "
+    yield "]}"
+
+
+def iter_csv(table, chunk_rows: int = RESPONSE_CHUNK_ROWS) -> Iterator[str]:
+    """Header line, then CSV rows a chunk at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.columns)
+    for chunk in _row_chunks(table, chunk_rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_arrow(table, chunk_rows: int = RESPONSE_CHUNK_ROWS) -> Iterator[bytes]:
+    """Arrow IPC stream, one record batch per chunk (numeric columns are not copied)"""
+    import pyarrow as pa
+
+    arrow_table = pa.Table.from_arrays([pa.array(array) for array in table.arrays], names=table.columns)
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, arrow_table.schema) as writer:
+        for batch in arrow_table.to_batches(max_chunksize=chunk_rows):
+            writer.write_batch(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_text(table, chunk_rows: int = RESPONSE_CHUNK_ROWS) -> Iterator[str]:
+    """Plain-text table of every row"""
+    yield f"{'  |  '.join(table.columns)}\n"
+    for chunk in _row_chunks(table, chunk_rows):
+        yield "".join(f"{'  |  '.join(map(str, row))}\n" for row in chunk)
+
+
+_ENCODERS = {"json": iter_json, "csv": iter_csv, "arrow": iter_arrow, "text": iter_text}
+
+
+def encode_table(table, fmt: str, chunk_rows: int = RESPONSE_CHUNK_ROWS) -> Iterator[bytes]:
+    """Byte chunks of the table in the given format"""
+    for piece in _ENCODERS[fmt](table, chunk_rows):
+        yield piece.encode() if isinstance(piece, str) else piece
+
+
+def table_response(table, fmt: str, accept_encoding: Optional[str] = None, limit: Optional[int] = None,
+                   chunk_rows: int = RESPONSE_CHUNK_ROWS) -> Tuple[Iterator[bytes], Dict[str, str]]:
+    """Streamed body and headers for a result table; rows are capped at RESPONSE_MAX_ROWS"""
+    if fmt == "arrow":
+        import pyarrow  # noqa: F401  (fail before streaming starts, not halfway through)
+    # A negative limit would slice rows off the end instead
+    limit = RESPONSE_MAX_ROWS if limit is None else min(max(limit, 0), RESPONSE_MAX_ROWS)
+    headers = {"Content-Type": CONTENT_TYPES[fmt], "Vary": "Accept-Encoding",
+               "X-Total-Rows": str(len(table))}
+    if len(table) > limit:
+        headers["X-Truncated"] = "true"
+        table = table[:limit]
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return compress_chunks(encode_table(table, fmt, chunk_rows), encoding), headers
+
+
+def iter_records_json(columns, batches: Iterable[list], key: str = "records") -> Iterator[str]:
+    """{key: [{column: value, ...}, ...]} written a batch of rows at a time"""
+    yield f'{{{json.dumps(key)}: ['
+    separator = ""
+    for rows in batches:
+        if rows:
+            yield separator + json.dumps([dict(zip(columns, row)) for row in rows], default=str)[1:-1]
+            separator = ", "
+    yield "]}"
+
+
+def iter_records_csv(columns, batches: Iterable[list]) -> Iterator[str]:
+    """Header line, then CSV rows a batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def records_response(columns, batches: Iterable[list], fmt: str, accept_encoding: Optional[str] = None,
+                     key: str = "records") -> Tuple[Iterator[bytes], Dict[str, str]]:
+    """Streamed JSON or CSV body and headers for row batches read lazily (e.g. from a cursor)"""
+    pieces = iter_records_csv(columns, batches) if fmt == "csv" else iter_records_json(columns, batches, key)
+    headers = {"Content-Type": CONTENT_TYPES[fmt], "Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return compress_chunks((piece.encode() for piece in pieces), encoding), headers
@@ -0,0 +1,121 @@
+"""
+Columnar query results.
+
+A ``ResultTable`` holds one NumPy array per column. The executor builds it
+once from the cursor rows; joins, formatting, charts and report storage
+work on the columns directly instead of copying rows back and forth
+between tuples and DataFrames.
+
+It still behaves like the old list of row tuples (``len``, iteration,
+``results[0][0]``, ``results[:20]``) so existing callers keep working.
+"""
+
+from typing import List, Sequence
+
+import numpy as np
+
+# Python types stored in a typed array; everything else (str, Decimal, dates, None) stays object
+_NUMERIC_DTYPES = {
+    frozenset([int]): np.int64,
+    frozenset([float]): np.float64,
+    frozenset([int, float]): np.float64,
+}
+
+
+def _to_array(values: Sequence) -> np.ndarray:
+    """One column of Python values as a typed array where possible"""
+    dtype = _NUMERIC_DTYPES.get(frozenset(map(type, values)))
+    if dtype is not None:
+        try:
+            return np.fromiter(values, dtype=dtype, count=len(values))
+        except OverflowError:
+            pass
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _python_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ResultTable:
+    """Column names plus one NumPy array per column"""
+
+    __slots__ = ("columns", "arrays")
+
+    def __init__(self, columns: Sequence[str], arrays: Sequence[np.ndarray]):
+        if len(columns) != len(arrays):
+            raise ValueError(f"{len(columns)} column names for {len(arrays)} arrays")
+        self.columns = list(columns)
+        self.arrays = list(arrays)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence], columns: Sequence[str]) -> "ResultTable":
+        """Transpose fetched rows into columns (the one row-to-column conversion)"""
+        if not rows:
+            return cls(columns, [np.empty(0, dtype=object) for _ in columns])
+        return cls(columns, [_to_array(values) for values in zip(*rows)])
+
+    @classmethod
+    def from_pandas(cls, frame, columns: Sequence[str] = None) -> "ResultTable":
+        """Wrap DataFrame columns, optionally renaming them"""
+        return cls(columns or list(frame.columns), [frame[name].to_numpy() for name in frame.columns])
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ResultTable":
+        """Inverse of to_dict()"""
+        return cls(data["columns"], [_to_array(values) for values in data["data"]])
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.arrays[0]) if self.arrays else 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays)
+
+    def __len__(self):
+        return self.num_rows
+
+    def __iter__(self):
+        return zip(*(array.tolist() for array in self.arrays))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            # Views, no copy
+            return ResultTable(self.columns, [array[key] for array in self.arrays])
+        return tuple(_python_value(array[key]) for array in self.arrays)
+
+    def __repr__(self):
+        return f"ResultTable(columns={self.columns}, rows={self.num_rows})"
+
+    def column(self, name: str) -> np.ndarray:
+        return self.arrays[self.columns.index(name)]
+
+    def take(self, indices) -> "ResultTable":
+        """Rows at the given positions (or boolean mask)"""
+        return ResultTable(self.columns, [array[indices] for array in self.arrays])
+
+    def rename(self, columns: Sequence[str]) -> "ResultTable":
+        return ResultTable(columns, self.arrays)
+
+    def rows(self) -> List[tuple]:
+        """Row tuples of Python values"""
+        return list(self)
+
+    def to_pandas(self):
+        """DataFrame over the same arrays (pandas is only imported here)"""
+        import pandas as pd
+        return pd.DataFrame(dict(zip(self.columns, self.arrays)), copy=False)
+
+    def to_dict(self) -> dict:
+        """Column-oriented JSON-ready form: {"columns": [...], "data": [[column values], ...]}"""
+        return {"columns": self.columns, "data": [array.tolist() for array in self.arrays]}
+
+
+def as_table(results, columns) -> ResultTable:
+    """Accept either a ResultTable or a list of row tuples"""
+    if isinstance(results, ResultTable):
+        return results
+    return ResultTable.from_rows(results, columns)
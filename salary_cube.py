@@ -0,0 +1,311 @@
+"""
+Pre-aggregated salary cube for the common analytical questions.
+
+Per department it keeps count/sum/min/max, distinct employees, salary
+histogram buckets and the top-K salaries, over the same distinct
+(employee name, department name, amount) rows the join engine uses. It is
+kept current incrementally: new salary rows are picked up by id
+high-water mark, while a change to the employee snapshot, a row count
+that doesn't add up (deletes) or a SUM(amount) that doesn't (in-place
+UPDATEs of amounts), or ``max_age`` triggers a full rebuild. An update
+that leaves both the count and the sum unchanged (two amounts swapped,
+or an employee_id reassigned) is only picked up by the ``max_age``
+rebuild.
+
+Answers are served from memory; a stale cube refreshes itself in a
+background thread and keeps answering from the last state meanwhile. A
+failed refresh is retried no sooner than ``refresh_interval`` later, so an
+outage doesn't turn every question into another refresh attempt.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+import numpy as np
+
+import federated_join
+from intent_router import DEFAULT_TOP_N
+from result_table import ResultTable
+
+CUBE_REFRESH_SECONDS = float(os.getenv("CUBE_REFRESH_SECONDS", "60"))
+CUBE_MAX_AGE_SECONDS = float(os.getenv("CUBE_MAX_AGE_SECONDS", "3600"))
+CUBE_TOP_K = int(os.getenv("CUBE_TOP_K", "10"))
+CUBE_BUCKET_WIDTH = int(os.getenv("CUBE_BUCKET_WIDTH", "10000"))
+
+SALARIES_QUERY = "SELECT id, employee_id, amount FROM salaries"
+SALARIES_SINCE_QUERY = SALARIES_QUERY + " WHERE id > {high_water}"
+SALARIES_VERSION_QUERY = "SELECT COUNT(*), MAX(id), SUM(amount) FROM salaries"
+
+HISTOGRAM_COLUMNS = ['Department', 'Salary Band', 'Count']
+
+
+class _DistinctKeys:
+    """(entity, amount) pairs seen so far
+
+    Integer amounts are packed into one int64 per pair and kept in a sorted
+    array; anything else falls back to a set of tuples.
+    """
+
+    AMOUNT_OFFSET = 1 << 31
+
+    def __init__(self):
+        self._packed = np.empty(0, dtype=np.int64)
+        self._pairs = None
+
+    def add(self, entities: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+        """Positions of pairs not seen before (first occurrence within the batch)"""
+        first = federated_join.first_occurrences(entities, amounts)
+        entities, amounts = entities[first], amounts[first]
+        if self._pairs is None and amounts.dtype.kind in "iu" and (
+                not len(amounts) or (amounts.min() >= -self.AMOUNT_OFFSET and amounts.max() < self.AMOUNT_OFFSET)):
+            packed = (entities << 32) | (amounts.astype(np.int64) + self.AMOUNT_OFFSET)
+            new = ~np.isin(packed, self._packed, assume_unique=True)
+            self._packed = np.union1d(self._packed, packed[new])
+            return first[new]
+        if self._pairs is None:
+            self._pairs = {(int(packed >> 32), int(packed & 0xFFFFFFFF) - self.AMOUNT_OFFSET)
+                           for packed in self._packed.tolist()}
+            self._packed = np.empty(0, dtype=np.int64)
+        new = []
+        for i, pair in enumerate(zip(entities.tolist(), amounts.tolist())):
+            if pair not in self._pairs:
+                self._pairs.add(pair)
+                new.append(i)
+        return first[np.asarray(new, dtype=np.int64)]
+
+
+class _CubeState:
+    """Aggregates for one employee dimension"""
+
+    def __init__(self, dimension, top_k: int, bucket_width: int):
+        size = dimension.department_count
+        self.dimension = dimension
+        self.top_k = top_k
+        self.bucket_width = bucket_width
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.totals = np.zeros(size, dtype=np.float64)
+        self.minimums = np.full(size, np.inf)
+        self.maximums = np.full(size, -np.inf)
+        self.has_salary = np.zeros(len(dimension.employee_ids), dtype=bool)
+        self.histogram = Counter()  # (department code, bucket) -> rows
+        self.top_rows = np.empty(0, dtype=np.int64)
+        self.top_amounts = np.empty(0, dtype=np.float64)
+        self.integer_amounts = True
+        self.distinct = _DistinctKeys()
+        self.high_water = None
+        self.rows_seen = 0
+        self.amount_sum = 0.0  # over every row seen, matched or not (checked against SUM(amount))
+
+    def apply(self, chunk: ResultTable):
+        """Fold one chunk of (id, employee_id, amount) salary rows into the aggregates"""
+        ids = chunk.column("id")
+        if len(ids):
+            chunk_max = int(ids.max())
+            self.high_water = chunk_max if self.high_water is None else max(self.high_water, chunk_max)
+        self.rows_seen += len(ids)
+        self.amount_sum += _amount_sum(chunk)
+
+        dimension = self.dimension
+        rows = dimension.index.lookup(chunk.column("employee_id"))
+        matched = rows >= 0
+        rows, amounts = rows[matched], chunk.column("amount")[matched]
+        if amounts.dtype.kind not in "iuf":
+            amounts = amounts.astype(np.float64)
+        self.integer_amounts = self.integer_amounts and amounts.dtype.kind in "iu"
+
+        new = self.distinct.add(dimension.entity_codes(rows), amounts)
+        rows, amounts = rows[new], amounts[new]
+        if not len(rows):
+            return
+
+        departments = dimension.department_codes[rows]
+        size = dimension.department_count
+        self.counts += np.bincount(departments, minlength=size)
+        self.totals += np.bincount(departments, weights=amounts, minlength=size)
+        np.minimum.at(self.minimums, departments, amounts)
+        np.maximum.at(self.maximums, departments, amounts)
+        self.has_salary[rows] = True
+
+        buckets = np.floor_divide(amounts, self.bucket_width).astype(np.int64)
+        pairs, pair_counts = np.unique(np.stack([departments.astype(np.int64), buckets]), axis=1, return_counts=True)
+        self.histogram.update({(int(d), int(b)): int(c) for (d, b), c in zip(pairs.T.tolist(), pair_counts.tolist())})
+
+        # Candidates come first, so ties keep the earliest row as the join engine does
+        top_rows = np.concatenate([self.top_rows, rows])
+        top_amounts = np.concatenate([self.top_amounts, amounts.astype(np.float64)])
+        keep = federated_join.top_n_positions(dimension.department_codes[top_rows], top_amounts, self.top_k)
+        self.top_rows, self.top_amounts = top_rows[keep], top_amounts[keep]
+
+    def _amounts(self, values: np.ndarray) -> np.ndarray:
+        return values.astype(np.int64) if self.integer_amounts else values
+
+    def summary(self) -> ResultTable:
+        present = self.counts > 0
+        employees = np.bincount(self.dimension.department_codes[self.has_salary],
+                                minlength=self.dimension.department_count)
+        counts, totals = self.counts[present], self.totals[present]
+        return ResultTable(federated_join.SUMMARY_COLUMNS, [
+            self.dimension.department_names[present],
+            employees[present],
+            np.round(totals / counts, 2),
+            self._amounts(totals),
+            self._amounts(self.minimums[present]),
+            self._amounts(self.maximums[present]),
+        ])
+
+    def top(self, top_n: int) -> ResultTable:
+        keep = federated_join.top_n_positions(self.dimension.department_codes[self.top_rows], self.top_amounts, top_n)
+        return federated_join.row_table(self.dimension, self.top_rows[keep], self._amounts(self.top_amounts[keep]))
+
+    def distribution(self, by_department: bool) -> ResultTable:
+        if by_department:
+            cells = sorted(self.histogram.items())
+        else:
+            totals = Counter()
+            for (_, bucket), count in self.histogram.items():
+                totals[bucket] += count
+            cells = sorted(((None, bucket), count) for bucket, count in totals.items())
+        departments = np.empty(len(cells), dtype=object)
+        departments[:] = [self.dimension.department_names[d] if d is not None else "All"
+                          for (d, _), _ in cells]
+        bands = np.empty(len(cells), dtype=object)
+        bands[:] = [f"{b * self.bucket_width:,}-{(b + 1) * self.bucket_width - 1:,}" for (_, b), _ in cells]
+        counts = np.fromiter((count for _, count in cells), dtype=np.int64, count=len(cells))
+        return ResultTable(HISTOGRAM_COLUMNS, [departments, bands, counts])
+
+
+def _amount_sum(chunk: ResultTable) -> float:
+    amounts = chunk.column("amount")
+    return float(amounts.astype(np.float64).sum()) if len(amounts) else 0.0
+
+
+class SalaryCube:
+    """Materialized per-department salary aggregates, refreshed incrementally"""
+
+    def __init__(self, dimension_loader: Callable, salary_stream: Callable, query_executor: Callable,
+                 refresh_interval: float = CUBE_REFRESH_SECONDS, max_age: float = CUBE_MAX_AGE_SECONDS,
+                 top_k: int = CUBE_TOP_K, bucket_width: int = CUBE_BUCKET_WIDTH):
+        # dimension_loader() -> (EmployeeDimension, None) or (None, error)
+        self.dimension_loader = dimension_loader
+        # salary_stream(sql_query) -> iterable of ResultTable chunks from db2
+        self.salary_stream = salary_stream
+        # query_executor(sql_query, db_name, guarded=False) -> (ResultTable, columns) or (None, error)
+        self.query_executor = query_executor
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.top_k = top_k
+        self.bucket_width = bucket_width
+        self._state: Optional[_CubeState] = None
+        self._built_at = 0.0
+        self._refreshed_at = 0.0  # last successful refresh
+        self._refresh_attempted_at = 0.0  # last refresh, successful or not
+        self._answers = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    def can_answer(self, intent) -> bool:
+        """Whether answer() would serve this intent (starts a refresh if the cube is stale)"""
+        kind = self._kind(intent)
+        if kind is None:
+            return False
+        self.refresh_in_background()
+        return self.ready and (kind != "top" or (intent.top_n or DEFAULT_TOP_N) <= self.top_k)
+
+    def answer(self, intent) -> Optional[ResultTable]:
+        """Cube answer for the intent, or None if it doesn't match or the cube isn't built yet"""
+        if not self.can_answer(intent):
+            return None
+        kind = self._kind(intent)
+        key = (kind, intent.top_n if kind == "top" else intent.has("department"))
+        with self._lock:
+            results = self._answers.get(key)
+            if results is None:
+                state = self._state
+                if kind == "top":
+                    results = state.top(intent.top_n or DEFAULT_TOP_N)
+                elif kind == "distribution":
+                    results = state.distribution(by_department=intent.has("department"))
+                else:
+                    results = state.summary()
+                self._answers[key] = results
+            return results
+
+    @staticmethod
+    def _kind(intent) -> Optional[str]:
+        if not intent.has("salary"):
+            return None
+        if intent.has("top", "department"):
+            return "top"
+        if intent.has("distribution"):
+            return "distribution"
+        if intent.has("department", "per_group") and not intent.has("employee"):
+            return "summary"
+        return None
+
+    def refresh_in_background(self):
+        """Start a refresh thread if the cube is stale and none is running"""
+        if time.monotonic() - self._refresh_attempted_at < self.refresh_interval or self._refresh_lock.locked():
+            return
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self, force_rebuild: bool = False):
+        """Apply new salary rows, or rebuild when incremental maintenance can't be trusted"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            dimension, error = self.dimension_loader()
+            if dimension is None:
+                print(f"Error refreshing salary cube: {error}")
+                return
+            state = self._state
+            rebuild = (force_rebuild or state is None or state.dimension is not dimension
+                       or time.time() - self._built_at >= self.max_age)
+            if not rebuild:
+                rebuild = not self._apply_new_rows(state)
+            if rebuild:
+                self._rebuild(dimension)
+            self._refreshed_at = time.monotonic()
+        except Exception as e:
+            print(f"Error refreshing salary cube: {e}")
+        finally:
+            self._refresh_attempted_at = time.monotonic()
+            self._refresh_lock.release()
+
+    def _apply_new_rows(self, state: _CubeState) -> bool:
+        """Fold rows above the high-water mark in; False if the table changed in other ways"""
+        if state.high_water is None:
+            chunks = list(self.salary_stream(SALARIES_QUERY))
+        else:
+            chunks = list(self.salary_stream(SALARIES_SINCE_QUERY.format(high_water=int(state.high_water))))
+        version, error = self.query_executor(SALARIES_VERSION_QUERY, "db2", guarded=False)
+        if version is None:
+            raise ConnectionError(error)
+        row_count, _, amount_sum = version[0]
+        if row_count != state.rows_seen + sum(len(chunk) for chunk in chunks):
+            return False
+        expected_sum = state.amount_sum + sum(_amount_sum(chunk) for chunk in chunks)
+        if not math.isclose(float(amount_sum or 0), expected_sum, rel_tol=1e-9, abs_tol=0.01):
+            return False
+        if chunks:
+            with self._lock:
+                for chunk in chunks:
+                    state.apply(chunk)
+                self._answers.clear()
+        return True
+
+    def _rebuild(self, dimension):
+        state = _CubeState(dimension, self.top_k, self.bucket_width)
+        for chunk in self.salary_stream(SALARIES_QUERY):
+            state.apply(chunk)
+        with self._lock:
+            self._state = state
+            self._built_at = time.time()
+            self._answers.clear()
@@ -0,0 +1,197 @@
+"""
+Schema catalog built from information_schema.
+
+Introspects every configured database, caches the result, re-checks a cheap
+fingerprint periodically to pick up schema changes, and renders only the
+tables relevant to a question's intent for the LLM prompt.
+"""
+
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_CHECK_INTERVAL = 300  # seconds between fingerprint checks
+
+# Which tables each intent concept needs
+CONCEPT_TABLES = {
+    "employee": {"employees"},
+    "department": {"departments", "employees"},
+    "salary": {"salaries"},
+}
+
+COLUMNS_QUERY = """
+    SELECT table_name, column_name, data_type, character_maximum_length, is_nullable
+    FROM information_schema.columns
+    WHERE table_schema = 'public'
+    ORDER BY table_name, ordinal_position
+"""
+
+CONSTRAINTS_QUERY = """
+    SELECT tc.table_name, kcu.column_name, tc.constraint_type,
+           ccu.table_name AS foreign_table, ccu.column_name AS foreign_column
+    FROM information_schema.table_constraints tc
+    JOIN information_schema.key_column_usage kcu
+      ON tc.constraint_name = kcu.constraint_name AND tc.table_schema = kcu.table_schema
+    LEFT JOIN information_schema.constraint_column_usage ccu
+      ON tc.constraint_type = 'FOREIGN KEY' AND tc.constraint_name = ccu.constraint_name
+    WHERE tc.table_schema = 'public' AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')
+"""
+
+FINGERPRINT_QUERY = """
+    SELECT md5(COALESCE(string_agg(table_name || '.' || column_name || ':' || data_type, ','
+                        ORDER BY table_name, ordinal_position), ''))
+    FROM information_schema.columns
+    WHERE table_schema = 'public'
+"""
+
+# Relationships that span databases can't be declared as foreign keys
+CROSS_DB_NOTES = {
+    ("db2", "salaries", "employee_id"): "references employees.id from db1",
+}
+
+QUERY_HINTS = {
+    "employees": "To get employee count: SELECT COUNT(*) FROM employees; (use db1)",
+    "salaries": "To get salary information: SELECT * FROM salaries; (use db2)",
+    "departments": ("To join employee and department data: SELECT e.name, d.name FROM employees e "
+                    "JOIN departments d ON e.department_id = d.id; (use db1)"),
+}
+
+
+class SchemaCatalog:
+    """Cached, introspected schema for all configured databases"""
+
+    def __init__(self, db_names: List[str], connect: Callable, fallback_schema: str = "",
+                 check_interval: int = DEFAULT_CHECK_INTERVAL):
+        self.db_names = list(db_names)
+        self.connect = connect
+        self.fallback_schema = fallback_schema
+        self.check_interval = check_interval
+        self.tables = {}  # db_name -> {table_name: [column dicts]}
+        self.fingerprints = {}  # db_name -> md5 of the column list
+        self._last_check = None
+        self._render_cache = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-introspect any database whose schema fingerprint changed.
+
+        Checks run at most once per ``check_interval`` unless forced. Returns
+        True if the cached schema changed.
+        """
+        if (not force and self._last_check is not None
+                and time.monotonic() - self._last_check < self.check_interval):
+            return False
+
+        with self._lock:
+            self._last_check = time.monotonic()
+            changed = False
+            for db_name in self.db_names:
+                conn = self.connect(db_name)
+                if not conn:
+                    continue
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(FINGERPRINT_QUERY)
+                    fingerprint = cursor.fetchone()[0]
+                    if fingerprint != self.fingerprints.get(db_name):
+                        self.tables[db_name] = self._introspect(cursor, db_name)
+                        self.fingerprints[db_name] = fingerprint
+                        changed = True
+                    cursor.close()
+                except Exception as e:
+                    print(f"Error introspecting schema for {db_name}: {e}")
+                finally:
+                    conn.close()
+
+            if changed:
+                self._render_cache.clear()
+            return changed
+
+    def _introspect(self, cursor, db_name: str) -> Dict[str, List[Dict]]:
+        """Read columns and key constraints for one database"""
+        cursor.execute(COLUMNS_QUERY)
+        tables = {}
+        for table, column, data_type, max_length, nullable in cursor.fetchall():
+            if max_length:
+                data_type = f"{data_type}({max_length})"
+            tables.setdefault(table, []).append({
+                "name": column,
+                "type": data_type,
+                "nullable": nullable == "YES",
+                "notes": [],
+            })
+
+        cursor.execute(CONSTRAINTS_QUERY)
+        for table, column, constraint_type, foreign_table, foreign_column in cursor.fetchall():
+            for col in tables.get(table, []):
+                if col["name"] != column:
+                    continue
+                if constraint_type == "PRIMARY KEY":
+                    col["notes"].append("primary key")
+                elif foreign_table:
+                    col["notes"].append(f"foreign key to {foreign_table}.{foreign_column}")
+
+        for (note_db, table, column), note in CROSS_DB_NOTES.items():
+            if note_db != db_name:
+                continue
+            for col in tables.get(table, []):
+                if col["name"] == column:
+                    col["notes"].append(note)
+
+        return tables
+
+    @property
+    def fingerprint(self) -> str:
+        """Combined fingerprint of all cached databases"""
+        combined = "|".join(f"{db}:{self.fingerprints.get(db, '')}" for db in self.db_names)
+        return hashlib.md5(combined.encode()).hexdigest()
+
+    def relevant_tables(self, intent=None) -> Optional[set]:
+        """Tables needed for an intent, or None for all tables"""
+        if intent is None:
+            return None
+        needed = set()
+        for concept in intent.concepts:
+            needed |= CONCEPT_TABLES.get(concept, set())
+        return needed or None
+
+    def render(self, intent=None) -> str:
+        """Render the schema (only relevant tables when an intent is given)"""
+        self.refresh()
+        if not self.tables:
+            return self.fallback_schema
+
+        needed = self.relevant_tables(intent)
+        cache_key = frozenset(needed) if needed else None
+        cached = self._render_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        lines = ["DATABASE SCHEMA:", ""]
+        hints = []
+        for db_name in self.db_names:
+            tables = self.tables.get(db_name, {})
+            selected = [t for t in sorted(tables) if needed is None or t in needed]
+            if not selected:
+                continue
+            lines.append(f"Database ({db_name}):")
+            for table in selected:
+                lines.append(f"- {table} table:")
+                for col in tables[table]:
+                    details = [col["type"]]
+                    if not col["nullable"] and "primary key" not in col["notes"]:
+                        details.append("not null")
+                    details.extend(col["notes"])
+                    lines.append(f"  - {col['name']} ({', '.join(details)})")
+                if table in QUERY_HINTS:
+                    hints.append(f"- {QUERY_HINTS[table]}")
+            lines.append("")
+
+        if hints:
+            lines.append("IMPORTANT NOTES:")
+            lines.extend(hints)
+
+        rendered = "\n".join(lines)
+        self._render_cache[cache_key] = rendered
+        return rendered
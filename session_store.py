@@ -0,0 +1,212 @@
+"""
+Session-scoped conversation store with bounded memory.
+
+- LRU eviction once the store holds more than ``max_sessions`` sessions
+- TTL expiry of idle sessions
+- Per-session token budget; older turns are folded into a short summary
+- Optional Redis backend (set ``REDIS_URL``) so several workers share sessions
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_KEEP_RECENT = 6
+SUMMARY_BUDGET_SHARE = 0.25  # the folded summary gets at most this share of the token budget
+SUMMARY_PREFIX = "Summary of earlier conversation: "
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _messages_tokens(messages: List[Dict]) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def enforce_token_budget(messages: List[Dict], token_budget: int,
+                         keep_recent: int = DEFAULT_KEEP_RECENT) -> List[Dict]:
+    """Trim a message list so it fits within the token budget.
+
+    System messages are kept, the oldest user/assistant turns are folded into a
+    single summary message, and if the recent turns alone are still too large
+    their contents are truncated.
+    """
+    if _messages_tokens(messages) <= token_budget:
+        return messages
+
+    system = [m for m in messages if m["role"] == "system" and not m["content"].startswith(SUMMARY_PREFIX)]
+    summaries = [m["content"][len(SUMMARY_PREFIX):] for m in messages
+                 if m["role"] == "system" and m["content"].startswith(SUMMARY_PREFIX)]
+    turns = [m for m in messages if m["role"] != "system"]
+
+    # Fold the oldest turns into the summary until we fit or only recent ones remain
+    folded = []
+    while len(turns) > keep_recent and _messages_tokens(system + turns) + estimate_tokens(
+            SUMMARY_PREFIX + " | ".join(summaries + folded)) > token_budget:
+        oldest = turns.pop(0)
+        if oldest["role"] == "user":
+            folded.append(oldest["content"][:120])
+
+    trimmed = list(system)
+    summary_text = " | ".join(summaries + folded)
+    summary_chars = int(token_budget * SUMMARY_BUDGET_SHARE) * 4 - len(SUMMARY_PREFIX)
+    if summary_text and summary_chars > 0:
+        # Keep the most recent part of the summary
+        trimmed.append({"role": "system", "content": SUMMARY_PREFIX + summary_text[-summary_chars:]})
+
+    # Still over budget: truncate each remaining turn evenly
+    remaining = token_budget - _messages_tokens(trimmed)
+    if turns and _messages_tokens(turns) > remaining:
+        per_turn_chars = max(4, (remaining * 4) // len(turns))
+        turns = [{"role": m["role"], "content": m["content"][:per_turn_chars]} for m in turns]
+
+    return trimmed + turns
+
+
+class SessionStore:
+    """In-memory conversation store with LRU and TTL eviction"""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET, keep_recent: int = DEFAULT_KEEP_RECENT):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self._sessions = OrderedDict()  # session_id -> (last_access, messages)
+        self._lock = threading.Lock()
+
+    def get_messages(self, session_id: str) -> List[Dict]:
+        """Get the (budgeted) messages for a session"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            last_access, messages = entry
+            if self._is_expired(last_access):
+                del self._sessions[session_id]
+                return []
+            self._sessions[session_id] = (time.monotonic(), messages)
+            self._sessions.move_to_end(session_id)
+            return list(messages)
+
+    def append(self, session_id: str, role: str, content: str):
+        """Append a message to a session, enforcing the token budget"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            messages = [] if entry is None or self._is_expired(entry[0]) else entry[1]
+            messages.append({"role": role, "content": content})
+            messages = enforce_token_budget(messages, self.token_budget, self.keep_recent)
+            self._sessions[session_id] = (time.monotonic(), messages)
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+    def clear(self, session_id: str):
+        """Drop all messages for a session"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _is_expired(self, last_access: float) -> bool:
+        return self.ttl_seconds > 0 and time.monotonic() - last_access > self.ttl_seconds
+
+    def _evict(self):
+        """Drop expired sessions from the LRU end, then enforce max_sessions"""
+        while self._sessions:
+            oldest_id, (last_access, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or self._is_expired(last_access):
+                del self._sessions[oldest_id]
+            else:
+                break
+
+
+class RedisSessionStore:
+    """Redis-backed conversation store shared across worker processes.
+
+    TTL is applied with EXPIRE on every write; LRU eviction is left to the
+    Redis ``maxmemory-policy`` (e.g. ``allkeys-lru``).
+    """
+
+    def __init__(self, redis_url: str, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET, keep_recent: int = DEFAULT_KEEP_RECENT,
+                 key_prefix: str = "sql_assistant:session:"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self._watch_error = redis.WatchError
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.key_prefix = key_prefix
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.key_prefix}{session_id}"
+
+    def get_messages(self, session_id: str) -> List[Dict]:
+        """Get the (budgeted) messages for a session"""
+        raw = self.client.get(self._key(session_id))
+        if raw is None:
+            return []
+        if self.ttl_seconds > 0:
+            self.client.expire(self._key(session_id), self.ttl_seconds)
+        return json.loads(raw)
+
+    def append(self, session_id: str, role: str, content: str):
+        """Append a message to a session, enforcing the token budget"""
+        key = self._key(session_id)
+        with self.client.pipeline() as pipe:
+            # Optimistic locking so concurrent workers don't drop each other's messages
+            while True:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    messages = json.loads(raw) if raw else []
+                    messages.append({"role": role, "content": content})
+                    messages = enforce_token_budget(messages, self.token_budget, self.keep_recent)
+                    pipe.multi()
+                    if self.ttl_seconds > 0:
+                        pipe.set(key, json.dumps(messages), ex=self.ttl_seconds)
+                    else:
+                        pipe.set(key, json.dumps(messages))
+                    pipe.execute()
+                    return
+                except self._watch_error:
+                    continue
+
+    def clear(self, session_id: str):
+        """Drop all messages for a session"""
+        self.client.delete(self._key(session_id))
+
+
+def format_history(messages: List[Dict], max_messages: Optional[int] = None) -> str:
+    """Render session messages as plain text for an LLM prompt
+
+    max_messages limits the recent user/assistant turns; system messages
+    (including the folded summary of older turns) are always kept.
+    """
+    if max_messages is not None:
+        system = [m for m in messages if m["role"] == "system"]
+        turns = [m for m in messages if m["role"] != "system"]
+        messages = system + (turns[-max_messages:] if max_messages > 0 else [])
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+def create_session_store(**kwargs):
+    """Create the session store; uses Redis when REDIS_URL is set"""
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        try:
+            redis_kwargs = {k: v for k, v in kwargs.items() if k != "max_sessions"}
+            return RedisSessionStore(redis_url, **redis_kwargs)
+        except Exception as e:
+            print(f"Error connecting to Redis session store, using in-memory store: {e}")
+    return SessionStore(**kwargs)
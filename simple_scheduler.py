@@ -1,7 +1,19 @@
+import asyncio
 import chainlit as cl
 from report_scheduler import ReportScheduler
 
 scheduler = ReportScheduler()
+scheduler.load_jobs()
+
+def parse_schedule_command(line):
+    """Report definition from a daily:/weekly:/hourly: command line, or None if it doesn't parse"""
+    schedule_type, _, rest = line.partition(":")
+    parts = [p.strip() for p in rest.split("|")]
+    if schedule_type in ("daily", "weekly") and len(parts) == 3:
+        return {"report_name": parts[0], "schedule_time": parts[1], "sql_query": parts[2], "schedule_type": schedule_type}
+    if schedule_type == "hourly" and len(parts) == 2:
+        return {"report_name": parts[0], "schedule_time": "", "sql_query": parts[1], "schedule_type": schedule_type}
+    return None
 
 @cl.on_chat_start
 async def start_chat():
@@ -11,6 +23,7 @@ async def start_chat():
                 "• `daily: Employee Count|09:00|SELECT COUNT(*) FROM employees`\n" +
                 "• `weekly: Weekly Report|MON:09:00|SELECT COUNT(*) FROM employees`\n" +
                 "• `hourly: System Check|SELECT COUNT(*) FROM employees`\n" +
+                "• Several commands, one per line, schedule them all at once\n" +
                 "• `show schedules` - View all scheduled reports\n" +
                 "• `show results` - View recent report executions"
     ).send()
@@ -18,15 +31,29 @@ async def start_chat():
 @cl.on_message
 async def main(message: cl.Message):
     content = message.content.strip()
+    lines = [line.strip() for line in content.splitlines() if line.strip()]
     
-    if content.startswith("daily:"):
+    if len(lines) > 1 and all(line.startswith(("daily:", "weekly:", "hourly:")) for line in lines):
+        # One command per line: all of them in a single transaction
+        definitions = [parse_schedule_command(line) for line in lines]
+        bad = [str(i + 1) for i, definition in enumerate(definitions) if definition is None]
+        if bad:
+            await cl.Message(content=f"❌ Could not parse line(s) {', '.join(bad)}; nothing was scheduled").send()
+            return
+        report_ids, errors = scheduler.schedule_reports(definitions)
+        if errors:
+            await cl.Message(content="❌ Nothing was scheduled:\n" + "\n".join(f"• {e}" for e in errors)).send()
+        else:
+            await cl.Message(content=f"✅ Scheduled {len(report_ids)} reports (IDs {report_ids[0]}-{report_ids[-1]})").send()
+            
+    elif content.startswith("daily:"):
         # Parse: daily: name|time|query
         parts = content[6:].strip().split("|")
         if len(parts) == 3:
             name, time, query = [p.strip() for p in parts]
             report_id = scheduler.schedule_report(name, query, "db1", "daily", time)
-            # Test run immediately
-            scheduler._run_report(report_id)
+            # Test run immediately, off the event loop (the query may wait for an admission slot)
+            await asyncio.to_thread(scheduler._run_report, report_id)
             await cl.Message(content=f"✅ Daily report '{name}' scheduled for {time} (ID: {report_id})\n🧪 Test executed - check console").send()
         else:
             await cl.Message(content="❌ Format: `daily: name|HH:MM|query`").send()
@@ -0,0 +1,186 @@
+"""
+Local snapshots of small, rarely-changing dimension tables.
+
+Registered tables (e.g. db1's departments and employees) are fetched once
+and served from memory. A cheap version query (row count + max id) is run
+at most every ``check_interval`` seconds and the snapshot is refetched only
+when the version moves, or after ``max_age`` as a backstop for in-place
+updates the version can't see.
+
+With a ``directory``, snapshots are also written as .npy column files and
+read back with ``mmap_mode="r"``, so worker processes on one host share a
+single page-cache copy and skip the initial fetch.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_CHECK_INTERVAL = 30  # seconds between version checks
+DEFAULT_MAX_AGE = 3600  # seconds before a refetch regardless of version
+
+
+@dataclass
+class Snapshot:
+    """One cached table"""
+    table: object  # ResultTable
+    version: Tuple
+    fetched_at: float  # wall clock, shared across processes via the metadata file
+    checked_at: float = field(default=0.0)  # monotonic, per process
+
+
+class SnapshotCache:
+    """Dimension tables served from memory, refreshed on change"""
+
+    def __init__(self, query_executor: Callable = None, directory: Optional[str] = None,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL, max_age: float = DEFAULT_MAX_AGE):
+        # Callable (sql_query, db_name, guarded=False) -> (ResultTable, columns) or (None, error)
+        self.query_executor = query_executor
+        self.directory = directory
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._tables = {}  # (db_name, table) -> (query, version query)
+        self._snapshots: Dict[Tuple[str, str], Snapshot] = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, query_executor: Callable = None) -> "SnapshotCache":
+        """Configured by DIMENSION_CACHE_DIR, DIMENSION_CHECK_SECONDS and DIMENSION_MAX_AGE_SECONDS"""
+        return cls(query_executor,
+                   directory=os.getenv("DIMENSION_CACHE_DIR") or None,
+                   check_interval=float(os.getenv("DIMENSION_CHECK_SECONDS", DEFAULT_CHECK_INTERVAL)),
+                   max_age=float(os.getenv("DIMENSION_MAX_AGE_SECONDS", DEFAULT_MAX_AGE)))
+
+    def register(self, db_name: str, table: str, query: str, key_column: Optional[str] = "id"):
+        """Cache the result of query; changes are detected by row count and max(key_column)"""
+        max_key = f"MAX({key_column})" if key_column else "NULL"
+        version_query = f"SELECT COUNT(*), {max_key} FROM {table}"
+        with self._lock:
+            self._tables[(db_name, table)] = (query, version_query)
+            self._locks[(db_name, table)] = threading.Lock()
+
+    def fetch(self, db_name: str, table: str):
+        """Cached table as (ResultTable, columns) or (None, error), like execute_sql_query"""
+        key = (db_name, table)
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and time.monotonic() - snapshot.checked_at < self.check_interval:
+            return snapshot.table, snapshot.table.columns
+
+        # One refresh per table at a time; other callers wait and then reuse it
+        with self._locks[key]:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and time.monotonic() - snapshot.checked_at < self.check_interval:
+                return snapshot.table, snapshot.table.columns
+            snapshot, error = self._refresh(key, snapshot)
+            if snapshot is None:
+                return None, error
+            self._snapshots[key] = snapshot
+            return snapshot.table, snapshot.table.columns
+
+    def invalidate(self, db_name: str = None, table: str = None):
+        """Force the next fetch to refetch (all tables, or matching ones)"""
+        with self._lock:
+            for key, snapshot in list(self._snapshots.items()):
+                if db_name in (None, key[0]) and table in (None, key[1]):
+                    snapshot.checked_at = 0.0
+                    snapshot.fetched_at = 0.0
+
+    def _refresh(self, key, snapshot: Optional[Snapshot]):
+        db_name, table = key
+        query, version_query = self._tables[key]
+        executor = self._get_query_executor()
+
+        rows, error = executor(version_query, db_name, guarded=False)
+        if rows is None:
+            if snapshot is not None:
+                # Serve the last known copy while the database is unreachable
+                print(f"Error checking {db_name}.{table} for changes, serving cached copy: {error}")
+                snapshot.checked_at = time.monotonic()
+                return snapshot, None
+            return None, error
+        version = tuple(rows[0]) if len(rows) else ()
+
+        if snapshot is None and self.directory:
+            snapshot = self._load(key)
+        if snapshot is None or snapshot.version != version or time.time() - snapshot.fetched_at >= self.max_age:
+            results, columns_or_error = executor(query, db_name, guarded=False)
+            if results is None:
+                if snapshot is not None:
+                    print(f"Error refreshing {db_name}.{table}, serving cached copy: {columns_or_error}")
+                    snapshot.checked_at = time.monotonic()
+                    return snapshot, None
+                return None, columns_or_error
+            snapshot = Snapshot(results, version, time.time())
+            if self.directory:
+                self._persist(key, snapshot)
+        snapshot.checked_at = time.monotonic()
+        return snapshot, None
+
+    def _get_query_executor(self):
+        """Query executor, defaulting to the shared database layer"""
+        if self.query_executor is None:
+            from database import execute_sql_query
+            self.query_executor = execute_sql_query
+        return self.query_executor
+
+    def _path(self, key, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key[0]}.{key[1]}{suffix}")
+
+    def _persist(self, key, snapshot: Snapshot):
+        """Write .npy column files and then the metadata that points at them"""
+        import numpy as np
+
+        arrays = []
+        for array in snapshot.table.arrays:
+            if array.dtype.kind == "O":
+                # Only all-string object columns have a fixed-width, mappable form
+                if not all(isinstance(value, str) for value in array.tolist()):
+                    return
+                array = np.array(array.tolist(), dtype=str)
+            arrays.append(array)
+
+        generation = f"{int(snapshot.fetched_at * 1000):x}"
+        try:
+            for i, array in enumerate(arrays):
+                path = self._path(key, f".{generation}.{i}.npy")
+                with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                    np.save(f, array, allow_pickle=False)
+                os.replace(f"{path}.{os.getpid()}.tmp", path)
+            meta = {"columns": snapshot.table.columns, "version": list(snapshot.version),
+                    "fetched_at": snapshot.fetched_at, "generation": generation}
+            meta_path = self._path(key, ".json")
+            with open(f"{meta_path}.{os.getpid()}.tmp", "w") as f:
+                json.dump(meta, f, default=str)
+            os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+        except OSError as e:
+            print(f"Error persisting snapshot of {key[0]}.{key[1]}: {e}")
+            return
+
+        # Older generations; processes that still map them keep their pages until they reload
+        for path in glob.glob(self._path(key, ".*.npy")):
+            if f".{generation}." not in os.path.basename(path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def _load(self, key) -> Optional[Snapshot]:
+        """Memory-map the persisted copy written by this or another process"""
+        import numpy as np
+        from result_table import ResultTable
+
+        try:
+            with open(self._path(key, ".json")) as f:
+                meta = json.load(f)
+            arrays = [np.load(self._path(key, f".{meta['generation']}.{i}.npy"), mmap_mode="r")
+                      for i in range(len(meta["columns"]))]
+        except (OSError, ValueError, KeyError):
+            return None
+        return Snapshot(ResultTable(meta["columns"], arrays), tuple(meta["version"]), meta["fetched_at"])
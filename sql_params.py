@@ -0,0 +1,182 @@
+"""
+SQL literal extraction and server-side prepared statements.
+
+``parameterize`` turns ``SELECT * FROM salaries WHERE amount > 50000`` into the
+template ``SELECT * FROM salaries WHERE amount > $1::bigint`` plus the value
+list ``[50000]``. The template doubles as a cache key for query patterns and
+plans, and is PREPAREd once per connection so recurring report SQL only pays
+for parsing and planning on first use.
+
+Literals whose exact type decides how the statement resolves stay inline: function
+arguments (``round(x, 2)``), type modifiers (``varchar(10)``) and select-list
+constants. As parameters they would change overload resolution and make the
+PREPARE fail.
+"""
+
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from decimal import Decimal
+from typing import List, Tuple
+
+from metrics import REGISTRY
+
+MAX_PREPARED_PER_CONNECTION = 100
+
+PREPARED_FALLBACKS = REGISTRY.counter(
+    "sql_assistant_prepared_fallbacks_total", "Queries executed unprepared", ["reason"])
+
+# Order matters: comments and quoted text must win over the literal patterns
+_TOKEN_RE = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<number>(?<![\w.$])\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w.]))
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<dollar>\$\d+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# A string following one of these is a typed literal (DATE '2024-01-01'), which can't take a parameter
+_TYPED_LITERAL_WORDS = {"date", "time", "timestamp", "timestamptz", "interval"}
+# Bare integers in these lists are column ordinals, not values
+_ORDINAL_CLAUSES = {"order", "group"}
+_ORDINAL_CLAUSE_END = {"limit", "offset", "having", "union", "intersect", "except", "window", "fetch", "for"}
+# A parenthesis after any other word opens a function call or a type modifier
+_EXPRESSION_PAREN_WORDS = {
+    "select", "from", "join", "where", "on", "and", "or", "not", "in", "exists", "any", "all", "some",
+    "as", "values", "when", "then", "else", "between", "by", "having", "limit", "offset", "is", "like",
+    "ilike", "using", "with", "union", "intersect", "except", "distinct", "case", "lateral",
+}
+
+
+def parameterize(sql: str) -> Tuple[str, List]:
+    """Extract literal values from SQL.
+
+    Returns (template, params) where every extracted literal is replaced by a
+    positional ``$n`` placeholder. Queries that already use placeholders are
+    returned unchanged.
+    """
+    parts = []
+    params = []
+    previous = ""  # previous significant token, lowercased
+    previous_kind = ""
+    in_ordinal_clause = False
+    # One entry per open parenthesis: [literals stay inline, inside a select list]
+    scopes = [[False, False]]
+
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        text = match.group()
+
+        if kind == "dollar":
+            return sql, []
+        if kind == "comment" or text.isspace():
+            parts.append(text)
+            continue
+
+        token = text.lower()
+        scope = scopes[-1]
+        inline = scope[0] or scope[1]
+        if kind == "word":
+            if token == "by" and previous in _ORDINAL_CLAUSES:
+                in_ordinal_clause = True
+            elif token in _ORDINAL_CLAUSE_END:
+                in_ordinal_clause = False
+            if token == "select":
+                scope[1] = True
+            elif token == "from":
+                scope[1] = False
+        elif token == "(":
+            call = previous_kind in ("word", "ident") and previous not in _EXPRESSION_PAREN_WORDS
+            scopes.append([scope[0] or call, False])
+        elif token == ")":
+            if len(scopes) > 1:
+                scopes.pop()
+        elif kind == "string" and not inline and previous not in _TYPED_LITERAL_WORDS:
+            params.append(text[1:-1].replace("''", "'"))
+            text = token = f"${len(params)}"
+        elif kind == "number" and not inline and not (in_ordinal_clause and previous in ("by", ",")):
+            # Integers are typed explicitly; decimals keep Postgres' numeric literal type
+            if text.isdigit():
+                params.append(int(text))
+                text = token = f"${len(params)}::bigint"
+            else:
+                params.append(Decimal(text))
+                text = token = f"${len(params)}::numeric"
+
+        parts.append(text)
+        previous = token
+        previous_kind = kind
+
+    return "".join(parts), params
+
+
+class PreparedStatementCache:
+    """Per-connection cache of server-side prepared statements"""
+
+    _by_connection = weakref.WeakKeyDictionary()
+    _registry_lock = threading.Lock()
+
+    def __init__(self, max_size: int = MAX_PREPARED_PER_CONNECTION):
+        self.max_size = max_size
+        self._statements = OrderedDict()  # template -> statement name
+        self._unpreparable = set()
+        self._counter = 0
+
+    @classmethod
+    def for_connection(cls, conn) -> "PreparedStatementCache":
+        """Get (or create) the cache for a connection"""
+        with cls._registry_lock:
+            cache = cls._by_connection.get(conn)
+            if cache is None:
+                cache = cls._by_connection[conn] = cls()
+            return cache
+
+    def execute(self, cursor, sql: str):
+        """Execute SQL through a prepared statement, preparing it on first use.
+
+        Falls back to plain execution for SQL that can't be prepared (the
+        template is remembered so the PREPARE isn't retried).
+        """
+        template, params = parameterize(sql)
+        if template in self._unpreparable:
+            PREPARED_FALLBACKS.inc(reason="known_unpreparable")
+            cursor.execute(sql)
+            return
+
+        name = self._statements.get(template)
+        if name is None:
+            name = self._prepare(cursor, template)
+            if name is None:
+                PREPARED_FALLBACKS.inc(reason="prepare_failed")
+                cursor.execute(sql)
+                return
+        else:
+            self._statements.move_to_end(template)
+
+        if params:
+            placeholders = ", ".join(["%s"] * len(params))
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def _prepare(self, cursor, template: str):
+        self._counter += 1
+        name = f"sqla_stmt_{self._counter}"
+        try:
+            cursor.execute(f"PREPARE {name} AS {template.strip().rstrip(';')}")
+        except Exception as e:
+            print(f"Could not prepare statement, executing directly: {e}")
+            self._unpreparable.add(template)
+            if len(self._unpreparable) > self.max_size:
+                self._unpreparable.clear()
+            cursor.connection.rollback()
+            return None
+
+        self._statements[template] = name
+        while len(self._statements) > self.max_size:
+            _, evicted = self._statements.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {evicted}")
+        return name
@@ -0,0 +1,79 @@
+"""
+SQLite access shared by threads and worker processes.
+
+The feedback and report stores are small SQLite files that every Gradio
+worker thread, Flask worker and scheduler job writes to. Each file is
+opened in WAL mode (readers don't block the writer) with a busy timeout
+(a locked writer waits instead of failing with "database is locked").
+Connections are per thread and per process, reused across calls, and
+writes take ``BEGIN IMMEDIATE`` under a per-file lock so a read-then-write
+transaction never has to upgrade its lock halfway through.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+class SQLiteStore:
+    """Thread-local WAL connections to one SQLite file"""
+
+    _write_locks = {}
+    _write_locks_guard = threading.Lock()
+
+    def __init__(self, db_path: str, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        # Stores opened on the same file in one process share a lock
+        with self._write_locks_guard:
+            self._write_lock = self._write_locks.setdefault(os.path.abspath(db_path), threading.Lock())
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, reopened after a fork"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: transactions are started explicitly in write()
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def read(self):
+        """Cursor for queries (sees the last committed state)"""
+        cursor = self.connection().cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def write(self):
+        """Cursor in an immediate transaction, committed on success and rolled back on error"""
+        conn = self.connection()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None